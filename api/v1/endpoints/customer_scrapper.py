@@ -1,4 +1,6 @@
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional
 from fastapi import APIRouter, HTTPException, Depends, Query
 
@@ -20,6 +22,9 @@ from services.playwright import CustomerService, NOC
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on concurrent detail-page requests per /customers-billing call
+DETAIL_FETCH_WORKERS = 8
+
 router = APIRouter()
 
 
@@ -55,10 +60,10 @@ def get_noc() -> NOC:
 # Endpoint show psb avaible
 @router.get("/psb", response_model=List[DataPSB])
 async def get_psb_data():
-    from services.playwright import get_psb_data_sync, run_sync
-    
-    # Run sync playwright in thread pool
-    results = await run_sync(get_psb_data_sync, True)
+    from services.playwright import submit
+
+    # Queued onto a Playwright worker
+    results = await submit("psb")
     
     return [
         DataPSB(
@@ -80,7 +85,9 @@ def get_customer_details_route(
 
     # 1. Search for customers to get their IDs
     search_results = billing_scraper.search(query)
-    logger.info(f"[customers-billing] Search results: {search_results}")
+    logger.info("[customers-billing] Search results: %d rows", len(search_results or []))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[customers-billing] Search payload: %s", search_results)
 
     if not search_results:
         logger.warning(f"[customers-billing] No customer found for query: {query}")
@@ -90,16 +97,24 @@ def get_customer_details_route(
 
     detailed_customers = []
 
-    # 2. Iterate through search results and fetch full details for each
-    for result in search_results:
-        cid = result.get("id")
-        logger.info(f"[customers-billing] Fetching details for customer ID: {cid}")
-        if cid:
-            customer_obj = billing_scraper.get_customer_details(cid)
-            logger.info(f"[customers-billing] Customer details result: {customer_obj}")
+    # 2. Fetch full details for every search result concurrently; the detail
+    # pages are independent GETs, each thread on its own copy of the login
+    ids = [r.get("id") for r in search_results if r.get("id")]
+    logger.debug("[customers-billing] Fetching details for customer IDs: %s", ids)
+    local = threading.local()
+
+    def fetch_details(customer_id: str):
+        if not hasattr(local, "scraper"):
+            local.scraper = billing_scraper.clone()
+        return local.scraper.get_customer_details(customer_id)
+
+    with ThreadPoolExecutor(max_workers=min(DETAIL_FETCH_WORKERS, len(ids) or 1)) as pool:
+        details = list(pool.map(fetch_details, ids))
 
-            if customer_obj:
-                detailed_customers.append(customer_obj)
+    for customer_obj in details:
+        logger.debug("[customers-billing] Customer details result: %s", customer_obj)
+        if customer_obj:
+            detailed_customers.append(customer_obj)
 
     if not detailed_customers:
         logger.warning(
@@ -168,11 +183,11 @@ async def get_customer_data_fast(
         - If multiple customers found: List of basic customer info for selection
         - If single customer found: Full customer details with invoices
     """
-    from services.playwright import get_customer_with_invoices_sync, run_sync
+    from services.playwright import submit
 
-    # Run sync playwright in thread pool (Windows compatible)
-    search_results, invoices_data = await run_sync(
-        get_customer_with_invoices_sync, search, True
+    # Queued onto a Playwright worker
+    search_results, invoices_data = await submit(
+        "customer_with_invoices", query=search
     )
 
     if not search_results:
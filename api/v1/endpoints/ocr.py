@@ -158,7 +158,7 @@ async def extract_text(file: UploadFile = File(...)):
         contents = await file.read()
 
         # Run OCR in thread pool (non-blocking)
-        loop = asyncio.get_event_loop()
+        loop = asyncio.get_running_loop()
         text = await loop.run_in_executor(_ocr_executor, _process_image_ocr, contents)
 
         return PlainTextResponse(content=text)
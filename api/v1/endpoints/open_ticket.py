@@ -28,17 +28,14 @@ from schemas.open_ticket import (
 router = APIRouter()
 
 
-# Async Wrapper for HTTP-only ticket creation
+# Async Wrapper for HTTP-only ticket creation. No browser is involved, so it
+# runs on the event loop directly instead of queueing behind Playwright jobs
 async def run_creation_async(query, desc, prio, jenis):
-    def _create():
-        service = CustomerService()
-        result = service.create_ticket(query, desc, prio, jenis)
-        if result:
-            return f"OK: Ticket created for {query}"
-        else:
-            return f"FAILED: Could not create ticket for {query}"
-
-    return await asyncio.to_thread(_create)
+    result = await CustomerService().create_ticket(query, desc, prio, jenis)
+    if result:
+        return f"OK: Ticket created for {query}"
+    else:
+        return f"FAILED: Could not create ticket for {query}"
 
 
 async def run_processing_async(noc_user, noc_pass, query, headless=True):
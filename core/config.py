@@ -44,6 +44,14 @@ class Settings(BaseSettings):
     BILLING_MODULE_BASE: str
     TICKET_NOC_URL: str
 
+    # --- Playwright ---
+    PW_WORKERS: int = 2  # queue workers sharing one browser, each with its own contexts
+    PW_CONTEXT_MAX_OPS: int = 200  # jobs served before a context is replaced
+    PW_CONTEXT_MAX_AGE: float = 600  # seconds a context is used before it is replaced
+    PW_OP_TIMEOUT: float = 30  # seconds a single job may run before it is abandoned
+    PW_WARM_START: bool = True  # start and log in each worker's session at startup
+    PW_CDP_ENDPOINT: str = ""  # e.g. ws://chromium:9222/ to share a sidecar browser
+
     class Config:
         env_file = ".env"
         env_file_encoding = 'utf-8'
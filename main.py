@@ -1,13 +1,31 @@
+import logging
+from contextlib import asynccontextmanager
 import uvicorn
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from api.v1.api import api_router
+from services.playwright import start_workers, stop_workers, workers_ready
+
+# Configured once here; service modules only create named loggers
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await start_workers()
+    yield
+    await stop_workers()
+
 
 # [FIX] Removed docs_url=None and redoc_url=None to enable default public docs
 app = FastAPI(
     title="Lexxadata Customer Scraper API",
     description="A structured API to search and scrape customer data from the NMS portal.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # --- FIX: Define specific origins ---
@@ -27,10 +45,20 @@ app.add_middleware(
 
 app.include_router(api_router, prefix="/api/v1")
 
+
 # --- YOUR API ROUTERS ---
 @app.get("/")
 def root():
     return {"API is running"}
 
+
+@app.get("/ready")
+def ready():
+    # 503 until the Playwright workers have logged in, so load balancers
+    # keep traffic off a cold instance
+    if not workers_ready():
+        return JSONResponse(status_code=503, content={"ready": False})
+    return {"ready": True}
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8002, reload=True, loop="asyncio")
@@ -12,24 +12,42 @@ from bs4 import BeautifulSoup
 
 from core import settings
 from schemas.customers_scrapper import Customer, TicketItem
+from services.billing_common import (
+    CAPTCHA_STRIP,
+    COORDINATE_RE,
+    MATH_CAPTCHA_RE,
+    MATH_OPS,
+    MONTH_EN,
+    MONTH_MAP_ID,
+    MONTH_NUM,
+    PERIOD_RE,
+    PHONE_RE,
+    TICKET_ROWS_SELECTOR,
+    parse_ticket_row,
+)
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 BILLING_COOKIE_FILE = "billing_session.pkl"
-MONTH_MAP_ID = {
-    "januari": "January",
-    "februari": "February",
-    "maret": "March",
-    "april": "April",
-    "mei": "May",
-    "juni": "June",
-    "juli": "July",
-    "agustus": "August",
-    "september": "September",
-    "oktober": "October",
-    "november": "November",
-    "desember": "December",
-}
+
+
+def _modals_by_target(soup: BeautifulSoup) -> Dict[str, object]:
+    """Map "#modaleditt<id>" data-target values to their invoice modal."""
+    return {
+        f"#{modal['id']}": modal
+        for modal in soup.select("div[id^='modaleditt']")
+    }
+
+
+def _profile_values(soup: BeautifulSoup) -> Dict[str, str]:
+    """Map each profile label ("User Join", "Paket", ...) to the text of its <span>."""
+    values = {}
+    for strong in soup.find_all("strong"):
+        value_span = strong.find_next_sibling("span")
+        if value_span:
+            label = strong.get_text(strip=True).rstrip(":").strip()
+            values.setdefault(label, value_span.get_text(strip=True))
+    return values
 
 
 class BillingScraper:
@@ -49,6 +67,16 @@ class BillingScraper:
             self.login_url = login_url or settings.LOGIN_URL_BILLING
             self._login()
 
+    def clone(self) -> "BillingScraper":
+        """A scraper on its own requests.Session that carries this one's login.
+
+        requests.Session is not thread-safe; give each thread its own clone.
+        """
+        session = requests.Session()
+        session.headers.update(self.session.headers)
+        session.cookies.update(self.session.cookies)
+        return BillingScraper(session=session)
+
     def _save_cookies(self):
         with open(BILLING_COOKIE_FILE, "wb") as f:
             pickle.dump(self.session.cookies, f)
@@ -145,35 +173,11 @@ class BillingScraper:
             Integer result if valid math expression, None otherwise
         """
         try:
-            # Remove all whitespace for easier parsing
-            clean = text.replace(" ", "").replace("=", "").replace("?", "")
-            
-            # Check if it matches a simple math pattern: number operator number
-            # Supports: +, -, *, /, x (as multiplication)
-            math_pattern = r'^(\d+)\s*([+\-*/x×])\s*(\d+)$'
-            match = re.match(math_pattern, clean, re.IGNORECASE)
-            
-            if match:
-                num1 = int(match.group(1))
-                operator = match.group(2).lower()
-                num2 = int(match.group(3))
-                
-                # Map operators
-                if operator == '+':
-                    result = num1 + num2
-                elif operator == '-':
-                    result = num1 - num2
-                elif operator in ['*', 'x', '×']:
-                    result = num1 * num2
-                elif operator == '/':
-                    result = num1 // num2  # Integer division
-                else:
-                    return None
-                
-                return int(result)
-            
-            return None
-            
+            match = MATH_CAPTCHA_RE.match(text.translate(CAPTCHA_STRIP))
+            if not match:
+                return None
+            num1, op, num2 = match.groups()
+            return MATH_OPS[op.lower()](int(num1), int(num2))
         except Exception as e:
             print(f"[BillingScraper] ⚠️ Math evaluation failed: {e}")
             return None
@@ -267,42 +271,24 @@ class BillingScraper:
     def _parse_month_year(
         text: str,
     ) -> Tuple[Optional[str], Optional[int], Optional[int]]:
-        if not text:
-            return None, None, None
-        t = text.strip()
-        low = t.lower()
-        for indo, eng in MONTH_MAP_ID.items():
-            if indo in low:
-                t = low.replace(indo, eng).title()
-                break
-        m = re.search(r"([A-Za-z]+)\s+(\d{4})", t)
+        m = PERIOD_RE.search(text or "")
         if not m:
             return None, None, None
-        mname, y = m.group(1), m.group(2)
-        try:
-            dt = datetime.strptime(f"{mname} {y}", "%B %Y")
-            return m.group(0), dt.month, dt.year
-        except Exception:
-            return m.group(0), None, None
+        month, year = MONTH_NUM[m.group(1).lower()], int(m.group(2))
+        return f"{MONTH_EN[month - 1]} {year}", month, year
 
     @staticmethod
     def _parser_whatsapp_url(mobile: str) -> Optional[str]:
-        if not mobile:
+        clean_number = (mobile or "").strip()
+        if not PHONE_RE.fullmatch(clean_number):
             return None
-        clean_number = mobile.strip()
-        if clean_number == "0":
-            return None
-
         return f"https://wa.me/{clean_number}"
 
     @staticmethod
     def _parser_maps_url(coordinate: str) -> Optional[str]:
-        if not coordinate:
-            return None
-        clean_coordinate = coordinate.strip()
-        if clean_coordinate == "0":
+        clean_coordinate = (coordinate or "").strip()
+        if not COORDINATE_RE.fullmatch(clean_coordinate):
             return None
-
         return f"https://www.google.com/maps?q={clean_coordinate}"
 
     def search(self, search_value: str) -> List[Dict]:
@@ -532,73 +518,30 @@ class BillingScraper:
             return None, ta_text
         return None, None
 
-    def parse_tickets(self, html_content: str) -> List[TicketItem]:
-        soup = BeautifulSoup(html_content, "html.parser")
+    def parse_tickets(self, html_content) -> List[TicketItem]:
+        # Accept an already-parsed page so callers don't build the tree twice
+        if isinstance(html_content, BeautifulSoup):
+            soup = html_content
+        else:
+            soup = BeautifulSoup(html_content, "html.parser")
         tickets = []
 
-        # Iterate through the table rows
-        rows = soup.select("table.table-bordered tbody tr")
-
-        for row in rows:
-            cols = row.find_all("td")
-            if len(cols) < 4:
-                continue
-
-            # --- 1. Basic Info ---
-            ref_id = cols[0].get_text(strip=True)
-
-            # Only include tickets that start with "TN"
-            if not ref_id.startswith("TN"):
-                continue
-
-            date_created = cols[1].get_text(strip=True)
-
-            # --- 2. Modal Extraction ---
-            modal = row.find("div", class_="modal")
-
-            ticket_description = None
-            ticket_action = None
-
-            if modal:
-                # Parse Timeline for Description and Action
-                timeline_items = modal.select(".track-order-list ul li")
-
-                for item in timeline_items:
-                    # Get Header (Actor) and Body (Message)
-                    h5_tag = item.find("h5")
-                    header_text = h5_tag.get_text(strip=True).upper() if h5_tag else ""
-
-                    date_p = item.find("p", class_="text-muted")
-                    body_text = ""
-                    if date_p:
-                        # The content is in the paragraph immediately following the date
-                        detail_p = date_p.find_next_sibling("p", class_="text-muted")
-                        if detail_p:
-                            body_text = detail_p.get_text(strip=True)
-
-                    # --- LOGIC ---
-
-                    # 1. Description: Comes from "OPENED"
-                    if "OPENED" in header_text and not ticket_description:
-                        ticket_description = body_text
-
-                    # 2. Action: Only capture if closed by TECHNICIAN or NOC
-                    # This explicitly ignores "CLOSED BY CS"
-                    if (
-                        "CLOSED BY TECHNICIAN" in header_text
-                        or "CLOSED BY NOC" in header_text
-                    ):
-                        ticket_action = body_text
-
-            # Append result
-            tickets.append(
-                TicketItem(
-                    ref_id=ref_id,
-                    date_created=date_created,
-                    description=ticket_description or "N/A",
-                    action=ticket_action or "Pending/Check Timeline",
-                )
-            )
+        # The Ticket Info rows; the rules are shared with the Playwright
+        # service (parse_ticket_row)
+        for row in soup.select(TICKET_ROWS_SELECTOR):
+            cells = [col.get_text(strip=True) for col in row.find_all("td")]
+            timeline = []
+            for item in row.select(".track-order-list ul li"):
+                # Header (actor) and body: the paragraph after the date
+                h5_tag = item.find("h5")
+                paragraphs = item.find_all("p", class_="text-muted")
+                timeline.append((
+                    h5_tag.get_text(strip=True) if h5_tag else "",
+                    paragraphs[1].get_text(strip=True) if len(paragraphs) > 1 else "",
+                ))
+            ticket = parse_ticket_row(cells, timeline)
+            if ticket is not None:
+                tickets.append(TicketItem(**ticket))
 
         return tickets
 
@@ -623,15 +566,11 @@ class BillingScraper:
             }
 
         soup = BeautifulSoup(res.text, "html.parser")
+        return self._invoice_data_from_soup(soup)
 
-        # Helper function to extract profile values (strong -> sibling span pattern)
-        def get_profile_value(label_text: str) -> str:
-            strong = soup.find("strong", string=lambda t: t and label_text in t)
-            if strong:
-                value_span = strong.find_next_sibling("span")
-                if value_span:
-                    return value_span.get_text(strip=True)
-            return None
+    def _invoice_data_from_soup(self, soup: BeautifulSoup) -> dict:
+        # Profile values (strong -> sibling span pattern), read in one scan
+        get_profile_value = _profile_values(soup).get
 
         # Extract profile values
         package_current = get_profile_value("Paket")
@@ -648,6 +587,7 @@ class BillingScraper:
                 mobile = mobile_raw
 
         # Extract coordinate from input name="coordinat" with value="lat,lng"
+        coordinate = None
         coord_input = soup.find("input", {"name": "coordinat"})
         if coord_input and coord_input.get("value"):
             coord_value = coord_input.get("value", "").strip()
@@ -702,6 +642,13 @@ class BillingScraper:
         timeline_items = soup.select(
             "ul.list-unstyled.timeline-sm > li.timeline-sm-item"
         )
+        # Index the "BC WA" modals once instead of searching the whole page per item
+        modals = _modals_by_target(soup)
+        # The summary is tallied while parsing; periods compare as year*12+month
+        now = datetime.now()
+        current_ym = now.year * 12 + now.month
+        this_month_invoice = None
+        arrears_count = 0
         for item in timeline_items:
             status_tag = item.select_one("span.timeline-sm-date span.badge")
             status = status_tag.get_text(strip=True) if status_tag else None
@@ -717,8 +664,7 @@ class BillingScraper:
             description = None
             bc_wa_button = item.select_one("button[data-target*='modaleditt']")
             if bc_wa_button and bc_wa_button.get("data-target"):
-                modal_id = bc_wa_button["data-target"]
-                modal = soup.select_one(modal_id)
+                modal = modals.get(bc_wa_button["data-target"])
                 if modal:
                     textarea = modal.select_one('textarea[name="deskripsi_edit"]')
                     if textarea:
@@ -726,37 +672,25 @@ class BillingScraper:
 
             period_norm, month, year = self._parse_month_year(period or "")
 
-            invoices.append(
-                {
-                    "status": status,
-                    "package": package_name,
-                    "period": period,
-                    "month": month,
-                    "year": year,
-                    "payment_link": payment_link,
-                    "amount": None,
-                    "description": description,
-                    "desc_parsed": {},
-                }
-            )
+            invoice = {
+                "status": status,
+                "package": package_name,
+                "period": period,
+                "month": month,
+                "year": year,
+                "payment_link": payment_link,
+                "amount": None,
+                "description": description,
+                "desc_parsed": {},
+            }
+            invoices.append(invoice)
 
-        now = datetime.now()
-        this_month_invoice = next(
-            (
-                inv
-                for inv in invoices
-                if inv.get("year") == now.year and inv.get("month") == now.month
-            ),
-            None,
-        )
-        arrears_count = sum(
-            1
-            for inv in invoices
-            if inv.get("status") == "Unpaid"
-            and inv.get("year") is not None
-            and inv.get("month") is not None
-            and (inv["year"], inv["month"]) < (now.year, now.month)
-        )
+            ym = year * 12 + month if year is not None and month is not None else 0
+            if ym == current_ym:
+                if this_month_invoice is None:
+                    this_month_invoice = invoice
+            elif 0 < ym < current_ym and status == "Unpaid":
+                arrears_count += 1
 
         return {
             "paket": package_current,
@@ -784,7 +718,9 @@ class BillingScraper:
             return None
 
         soup = BeautifulSoup(res.text, "html.parser")
+        return self._customer_from_soup(customer_id, soup)
 
+    def _customer_from_soup(self, customer_id: str, soup: BeautifulSoup) -> Customer:
         # --- A. Basic Profile Info ---
         # Name is in the h4 tag inside the profile card [cite: 64]
         # Address is in the paragraph immediately following the name [cite: 64]
@@ -803,15 +739,8 @@ class BillingScraper:
 
         # --- B. Key-Value Profile Details ---
         # These are stored in <p> tags with <strong> labels inside div.text-left.mt-3 [cite: 67-69]
-        def get_profile_value(label_text):
-            # Find the strong tag containing the label
-            label = soup.find("strong", string=lambda t: t and label_text in t)
-            if label:
-                # The value is in the next <span> sibling [cite: 67-69]
-                value_span = label.find_next_sibling("span")
-                if value_span:
-                    return value_span.get_text(strip=True)
-            return None
+        # One scan of the labels; the value is in the next <span> sibling [cite: 67-69]
+        get_profile_value = _profile_values(soup).get
 
         user_join = get_profile_value("User Join")
         # 'No Internet' in the HTML maps to 'user_pppoe' or 'id' in your model [cite: 68]
@@ -835,14 +764,14 @@ class BillingScraper:
 
         # Get ALL timeline items (invoices)
         all_invoice_items = soup.select("ul.timeline-sm li.timeline-sm-item")
+        modals = _modals_by_target(soup)
 
         for idx, invoice_item in enumerate(all_invoice_items):
             # Find the "BC WA" button to get the target modal ID
             wa_button = invoice_item.select_one("button[data-target^='#modaleditt']")
 
             if wa_button:
-                modal_id = wa_button.get("data-target")
-                modal = soup.select_one(modal_id)
+                modal = modals.get(wa_button.get("data-target"))
 
                 if modal:
                     textarea = modal.find("textarea", {"name": "deskripsi_edit"})
@@ -870,7 +799,7 @@ class BillingScraper:
                 if link and link not in invoice_links:
                     invoice_links.append(link)
 
-        tickets = self.parse_tickets(res.text)
+        tickets = self.parse_tickets(soup)
 
         # Return the populated model
         return Customer(
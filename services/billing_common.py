@@ -0,0 +1,79 @@
+"""Parsing tables shared by the requests scraper and the Playwright service."""
+
+import operator
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Month mapping for Indonesian to English
+MONTH_MAP_ID = {
+    "januari": "January",
+    "februari": "February",
+    "maret": "March",
+    "april": "April",
+    "mei": "May",
+    "juni": "June",
+    "juli": "July",
+    "agustus": "August",
+    "september": "September",
+    "oktober": "October",
+    "november": "November",
+    "desember": "December",
+}
+# Month number by Indonesian or English name, and one precompiled pattern
+# that finds "<Month> <YYYY>" in either language
+MONTH_EN = list(MONTH_MAP_ID.values())
+MONTH_NUM = {
+    **{name: i for i, name in enumerate(MONTH_MAP_ID, 1)},
+    **{name.lower(): i for i, name in enumerate(MONTH_EN, 1)},
+}
+PERIOD_RE = re.compile(r"\b(" + "|".join(MONTH_NUM) + r")\s+(\d{4})", re.IGNORECASE)
+
+# Math CAPTCHAs read like "10 - 2 = ?": spaces, "=" and "?" are dropped in one
+# translate() and the rest must be <number><operator><number>
+CAPTCHA_STRIP = str.maketrans("", "", " =?")
+MATH_CAPTCHA_RE = re.compile(r"^(\d+)\s*([+\-*/x×])\s*(\d+)$", re.IGNORECASE)
+MATH_OPS = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "x": operator.mul,
+    "×": operator.mul,
+    "/": operator.floordiv,  # Integer division
+}
+
+# What a usable phone number / "lat,long" pair looks like; anything else
+# (the "0" placeholder, free text) gets no link
+PHONE_RE = re.compile(r"\+?\d{6,15}")
+COORDINATE_RE = re.compile(r"-?\d+(?:\.\d+)?,\s*-?\d+(?:\.\d+)?")
+
+# Ticket Info table on the customer detail page: Ref / Date / Details / Action.
+# Only "TN..." refs are tickets; the rest of the row lives in its track-order modal.
+TICKET_ROWS_SELECTOR = "#timeline table.table-bordered > tbody > tr"
+
+
+def parse_ticket_row(cells: List[str], timeline: Iterable[Tuple[str, str]]) -> Optional[Dict]:
+    """Apply the ticket rules to one row of the Ticket Info table.
+
+    ``cells`` are the row's stripped cell texts and ``timeline`` the (header,
+    body) pairs of its track-order entries in page order. The description is
+    the first OPENED entry and the action the last one closed by a technician
+    or NOC (CLOSED BY CS is ignored). Returns None for rows that are not tickets.
+    """
+    if len(cells) < 4 or not cells[0].startswith("TN"):
+        return None
+
+    description = None
+    action = None
+    for header, body in timeline:
+        header = header.upper()
+        if "OPENED" in header and not description:
+            description = body
+        if "CLOSED BY TECHNICIAN" in header or "CLOSED BY NOC" in header:
+            action = body
+
+    return {
+        "ref_id": cells[0],
+        "date_created": cells[1],
+        "description": description or "N/A",
+        "action": action or "Pending/Check Timeline",
+    }
@@ -62,7 +62,7 @@ class ConnectionManager:
                     if not client.writer or client.writer.is_closing():
                         break
 
-                    now = asyncio.get_event_loop().time()
+                    now = asyncio.get_running_loop().time()
                     if now - client.last_activity > 50:
                         
                         if client.lock.locked():
@@ -74,7 +74,7 @@ class ConnectionManager:
                                     client.writer.write("\n")
                                     await client.writer.drain()
 
-                                    client.last_activity = asyncio.get_event_loop().time()
+                                    client.last_activity = asyncio.get_running_loop().time()
                                     
                                 except Exception as e:
                                     logging.warning(f"Gagal kirim keepalive: {e}")
@@ -137,7 +137,7 @@ class SwitchManager:
                 if not client.writer or client.writer.is_closing():
                     break
 
-                now = asyncio.get_event_loop().time()
+                now = asyncio.get_running_loop().time()
                 if now - client.last_activity > 50:
                     
                     if client.lock.locked():
@@ -148,7 +148,7 @@ class SwitchManager:
                             try:
                                 client.writer.write("\n")
                                 await client.writer.drain()
-                                client.last_activity = asyncio.get_event_loop().time()
+                                client.last_activity = asyncio.get_running_loop().time()
                             except Exception as e:
                                 logging.warning(f"Gagal kirim keepalive ke switch: {e}")
                                 break
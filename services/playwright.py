@@ -1,50 +1,51 @@
 import logging
+import os
 import re
-from datetime import datetime
 from typing import List, Dict, Optional, Tuple
 from core.config import settings
 from pathlib import Path
-from playwright.sync_api import sync_playwright, TimeoutError as PWTimeoutError
-from concurrent.futures import ThreadPoolExecutor
+from playwright.async_api import async_playwright
+from dataclasses import dataclass
 import asyncio
 import time
-import requests
-from bs4 import BeautifulSoup
-from api.v1.endpoints.ocr import _process_image_ocr as ocr
-from schemas.customers_scrapper import (
-    Customer,
-    TicketItem,
-    InvoiceItem,
-    BillingSummary,
-    CustomerwithInvoices,
+from concurrent.futures import Future, ThreadPoolExecutor
+import httpx
+import orjson
+from selectolax.lexbor import LexborHTMLParser
+from api.v1.endpoints.ocr import _process_image_ocr as ocr, _ocr_executor
+from services.billing_common import (
+    CAPTCHA_STRIP,
+    COORDINATE_RE,
+    MATH_CAPTCHA_RE,
+    MATH_OPS,
+    MONTH_EN,
+    MONTH_NUM,
+    PERIOD_RE,
+    PHONE_RE,
+    TICKET_ROWS_SELECTOR,
+    parse_ticket_row,
 )
 
-# Month mapping for Indonesian to English
-MONTH_MAP_ID = {
-    "januari": "January",
-    "februari": "February",
-    "maret": "March",
-    "april": "April",
-    "mei": "May",
-    "juni": "June",
-    "juli": "July",
-    "agustus": "August",
-    "september": "September",
-    "oktober": "October",
-    "november": "November",
-    "desember": "December",
-}
+__all__ = [
+    "BrowserPool",
+    "BROWSER_POOL",
+    "CustomerService",
+    "NOC",
+    "flush_sessions",
+    "start_workers",
+    "stop_workers",
+    "submit",
+    "workers_ready",
+]
 
-# Configure logging to show messages
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
-)
+logger = logging.getLogger(__name__)
 
 
 
 LOGIN_URL = settings.LOGIN_URL_BILLING
 DASHBOARD_URL_GLOB = "**/billing2/**"  # pattern for dashboard after login
 INVOICES_URL = settings.DETAIL_URL_BILLING
+SEARCH_URL = settings.BILLING_MODULE_BASE
 TICKET_URL = settings.TICKET_NOC_URL
 DATA_PSB_URL = settings.DATA_PSB_URL
 
@@ -59,6 +60,142 @@ password_noc = settings.NMS_PASSWORD
 SESSION_DIR = Path(__file__).parent / "sessions"
 SESSION_CS_FILE = SESSION_DIR / "session_cs.json"
 SESSION_NOC_FILE = SESSION_DIR / "session_noc.json"
+_SESSION_DIR_READY = False
+SESSION_WRITE_INTERVAL = 30  # min seconds between disk writes of one session
+AUTH_COOKIE_NAMES = {"PHPSESSID"}  # cookies that carry the billing login
+
+# Last known storage_state per session file. Contexts are created from the
+# cached dict so only a cold process ever parses the JSON file.
+_STATE_CACHE: Dict[Path, dict] = {}
+_STATE_WRITTEN_AT: Dict[Path, float] = {}
+_STATE_DIRTY: Dict[Path, bool] = {}  # cached state newer than the file
+# Session files are written off the event loop by a single thread, so writes
+# to one file never overlap and close()/recycle() don't wait on disk
+_SAVE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-save")
+
+# One login at a time per session file. Each successful credential login
+# bumps the file's generation; sessions behind an older generation copy the
+# new cookies from _STATE_CACHE instead of logging in themselves.
+_LOGIN_LOCKS: Dict[Path, asyncio.Lock] = {}
+_LOGIN_GENERATION: Dict[Path, int] = {}
+# The storage_state last copied into the shared HTTP client, per session file
+_HTTP_SEEDED: Dict[Path, dict] = {}
+
+# Parsed detail pages by customer id, so refreshes of the same customer within
+# INVOICE_CACHE_TTL seconds skip the navigation. Dropped when a ticket is made.
+INVOICE_CACHE_TTL = 30
+_INVOICE_CACHE: Dict[str, Tuple[float, Dict]] = {}
+
+# Resource types never needed for scraping; aborted before they hit the network
+BLOCKED_RESOURCES = {
+    "image", "stylesheet", "font", "media", "texttrack", "ping", "cspreport",
+}
+# Lean headless Chromium for server use: no /dev/shm (small in containers),
+# GPU, extensions, audio or background services
+CHROMIUM_ARGS = [
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-gpu",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-sync",
+    "--disable-features=TranslateUI",
+    "--mute-audio",
+    "--no-first-run",
+    # get_invoices_many drives several tabs at once; don't throttle the
+    # ones Chromium considers in the background
+    "--disable-background-timer-throttling",
+    "--disable-backgrounding-occluded-windows",
+    "--disable-renderer-backgrounding",
+]
+# Third-party trackers; their scripts only delay the load event
+BLOCKED_HOSTS = (
+    "googletagmanager", "google-analytics", "hotjar", "doubleclick", "facebook", "sentry",
+)
+
+# Plain HTTP client for server-rendered pages; reuses the browser's cookies
+def _new_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=10,
+        verify=False,
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=50),
+        headers={"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"},
+    )
+
+
+_http = _new_http_client()
+
+# Fills the login form and submits it in a single evaluate() call. Values go
+# through the native setter and an input event so page scripts see them.
+LOGIN_FILL_JS = """
+([username, password, captcha]) => {
+    const set = (selector, value) => {
+        const el = document.querySelector(selector);
+        if (!el || value === null) return;
+        Object.getOwnPropertyDescriptor(HTMLInputElement.prototype, "value").set.call(el, value);
+        el.dispatchEvent(new Event("input", { bubbles: true }));
+    };
+    set("input[placeholder='Username']", username);
+    set("input[placeholder='Password']", password);
+    set("input[name='captcha']", captcha);
+    const submit = Array.from(document.querySelectorAll("button"))
+        .find(b => b.textContent.trim() === "Sign In");
+    submit.click();
+}
+"""
+
+# Extracts the search results table in a single evaluate() call. The customer
+# id is the suffix of the row's "Add Note" modal target (#create_note_modal7341).
+SEARCH_ROWS_JS = """
+() => {
+    const byId = prefix => new Map(
+        Array.from(document.querySelectorAll(`div[id^='${prefix}']`), el => [el.id.slice(prefix.length), el])
+    );
+    const notes = byId("create_note_modal");
+    const migrations = byId("create_timi_pa");
+    return Array.from(document.querySelectorAll("table#create_note tbody tr"), row => {
+        const cells = row.cells;
+        const note = row.querySelector("a[data-target^='#create_note_modal']");
+        if (!note || cells.length < 5) return null;
+        const small = cells[1].querySelectorAll("small");
+        const text = el => (el ? el.innerText.trim() : "");
+        const id = note.getAttribute("data-target").slice("#create_note_modal".length);
+        const input = (modals, name) => {
+            const el = modals.get(id)?.querySelector(`input[name='${name}']`);
+            return el ? el.value : "";
+        };
+        return {
+            id,
+            name: text(cells[0].querySelector("h5")),
+            address: text(cells[0].querySelector("small")),
+            no_internet: text(small[0]),
+            pppoe_user: text(small[1]),
+            status: text(cells[2].querySelector("span.badge")),
+            package_status: text(cells[3].querySelector("span.badge")),
+            mobile: input(notes, "no_hp"),
+            coordinate: input(notes, "coordinat"),
+            package: input(migrations, "paket_lama"),
+        };
+    }).filter(Boolean);
+}
+"""
+
+# Extracts the PSB table (#tickets-note) in a single evaluate() call
+PSB_ROWS_JS = """
+table => Array.from(table.tBodies[0] ? table.tBodies[0].rows : [], row => {
+    const cells = Array.from(row.cells, c => c.innerText.trim());
+    const links = Array.from(row.querySelectorAll("a[data-target]"));
+    const details = links.find(a => a.textContent.includes("Details")) || links[0];
+    const target = details ? details.getAttribute("data-target") || "" : "";
+    const modal = target ? document.getElementById(target.replace(/^#/, "")) : null;
+    const pool = modal
+        ? Array.from(modal.querySelectorAll("p"), p => p.textContent)
+              .find(t => t.includes("Framed-Pool"))
+        : null;
+    return { cells, pool: pool || "" };
+})
+"""
 
 
 def _evaluate_math_captcha(text: str) -> Optional[int]:
@@ -66,121 +203,571 @@ def _evaluate_math_captcha(text: str) -> Optional[int]:
     Evaluate if CAPTCHA text is a math expression and return the answer.
     """
     try:
-        # Remove all whitespace for easier parsing
-        clean = text.replace(" ", "").replace("=", "").replace("?", "")
-        
-        # Check if it matches a simple math pattern: number operator number
-        # Supports: +, -, *, /, x (as multiplication)
-        math_pattern = r'^(\d+)\s*([+\-*/x×])\s*(\d+)$'
-        match = re.search(math_pattern, clean, re.IGNORECASE)
-        
-        if match:
-            num1 = int(match.group(1))
-            operator = match.group(2).lower()
-            num2 = int(match.group(3))
-            
-            # Map operators
-            if operator == '+':
-                result = num1 + num2
-            elif operator == '-':
-                result = num1 - num2
-            elif operator in ['*', 'x', '×']:
-                result = num1 * num2
-            elif operator == '/':
-                result = num1 // num2  # Integer division
-            else:
-                return None
-            
-            return int(result)
-        
-        return None
-        
+        match = MATH_CAPTCHA_RE.match(text.translate(CAPTCHA_STRIP))
+        if not match:
+            return None
+        num1, op, num2 = match.groups()
+        return MATH_OPS[op.lower()](int(num1), int(num2))
     except Exception as e:
-        print(f"⚠️ Math evaluation failed: {e}")
+        logger.warning("Math evaluation failed: %s", e)
         return None
 
-# Thread pool for running sync playwright in async context
-_executor = ThreadPoolExecutor(max_workers=2)
+def _parse_search_rows(html: str) -> List[Dict]:
+    """Parse the search results table (same shape as SEARCH_ROWS_JS).
 
+    Besides the visible columns, each row carries the contact, coordinate and
+    current package that the page pre-fills into that customer's modals.
+    """
+    tree = LexborHTMLParser(html)
 
-def run_sync(func, *args, **kwargs):
-    """Run a sync function in thread pool, return awaitable."""
-    loop = asyncio.get_event_loop()
-    return loop.run_in_executor(_executor, lambda: func(*args, **kwargs))
+    def text(node) -> str:
+        return node.text(strip=True) if node is not None else ""
 
+    # Index the modals by customer id once instead of searching per row
+    def modals_by_id(prefix: str) -> Dict[str, object]:
+        return {
+            node.attributes["id"][len(prefix):]: node
+            for node in tree.css(f"div[id^='{prefix}']")
+        }
 
-class CustomerService:
-    """Sync Playwright service for customer operations.
-    Use run_sync() wrapper when calling from async FastAPI endpoints.
+    notes = modals_by_id("create_note_modal")
+    migrations = modals_by_id("create_timi_pa")
+
+    def modal_input(modals: Dict[str, object], cid: str, name: str) -> str:
+        modal = modals.get(cid)
+        node = modal.css_first(f"input[name='{name}']") if modal is not None else None
+        return (node.attributes.get("value") or "") if node is not None else ""
+
+    rows = []
+    for row in tree.css("table#create_note tbody tr"):
+        cells = row.css("td")
+        note = row.css_first("a[data-target^='#create_note_modal']")
+        if note is None or len(cells) < 5:
+            continue
+        cid = note.attributes["data-target"][len("#create_note_modal"):]
+        small = cells[1].css("small")
+        rows.append({
+            "id": cid,
+            "name": text(cells[0].css_first("h5")),
+            "address": text(cells[0].css_first("small")),
+            "no_internet": text(small[0]) if len(small) > 0 else "",
+            "pppoe_user": text(small[1]) if len(small) > 1 else "",
+            "status": text(cells[2].css_first("span.badge")),
+            "package_status": text(cells[3].css_first("span.badge")),
+            "mobile": modal_input(notes, cid, "no_hp"),
+            "coordinate": modal_input(notes, cid, "coordinat"),
+            "package": modal_input(migrations, cid, "paket_lama"),
+        })
+    return rows
+
+
+# The detail page's invoice textarea holds a ready-made WhatsApp message:
+# "...tagihan internet bulan February 2026, ... Tagihan : Rp. 111,000
+# Link Payment : https://...". One DOTALL pattern reads all three fields.
+_INVOICE_TEXT_RE = re.compile(
+    r"bulan\s+(?P<period>[A-Za-z]+\s+\d{4})"
+    r".*?Tagihan\s*:\s*Rp\.?\s*(?P<amount>[\d.,]+)"
+    r".*?Link Payment\s*:\s*(?P<link>\S+)",
+    re.DOTALL | re.IGNORECASE,
+)
+
+# Profile labels on the customer detail page ("User Join :") -> result keys
+PROFILE_FIELDS = {
+    "User Join": "user_join",
+    "No Internet": "no_internet",
+    "Mobile": "mobile",
+    "NIK": "nik",
+    "Paket": "paket",
+    "Last Payment": "last_payment",
+    "Uptime": "uptime",
+    "Bw Usage Up/Down": "bw_usage",
+    "SN Modem": "sn_modem",
+}
+
+
+def _parse_invoice_text(text: str) -> Optional[Dict]:
+    """Pull period, amount and payment link out of the invoice message in one scan."""
+    m = _INVOICE_TEXT_RE.search(text)
+    if not m:
+        return None
+    period, month, year = CustomerService._parse_month_year(m.group("period"))
+    return {
+        "period": period,
+        "month": month,
+        "year": year,
+        "amount": m.group("amount"),
+        "payment_link": m.group("link"),
+    }
+
+
+def _parse_customer_detail(html: str) -> Dict:
+    """Parse profile fields, payment status and invoice text of a detail page."""
+    tree = LexborHTMLParser(html)
+    data = dict.fromkeys(PROFILE_FIELDS.values(), "")
+
+    def value_of(selector: str) -> str:
+        node = tree.css_first(selector)
+        return (node.attributes.get("value") or "") if node is not None else ""
+
+    card = tree.css_first("div.card-box.text-center")
+    name = card.css_first("h4") if card is not None else None
+    address = card.css_first("p.text-muted") if card is not None else None
+    data["id"] = value_of("input[name='id_pelanggan']")
+    data["name"] = name.text(strip=True) if name is not None else ""
+    data["address"] = address.text(strip=True) if address is not None else ""
+    data["coordinate"] = value_of("input[name='coordinat']")
+
+    for label in tree.css("p > strong"):
+        key = PROFILE_FIELDS.get(label.text(strip=True).rstrip(":").strip())
+        value = label.parent.css_first("span")
+        if key and value is not None:
+            data[key] = value.text(strip=True)
+
+    # Payment status is the PAID/UNPAID badge button next to ONLINE/Back
+    data["status"] = "UNKNOWN"
+    for button in tree.css("button.btn-xs"):
+        text = button.text(strip=True)
+        classes = button.attributes.get("class") or ""
+        if text == "PAID" and "btn-success" in classes:
+            data["status"] = "PAID"
+            break
+        if text == "UNPAID" and "btn-danger" in classes:
+            data["status"] = "UNPAID"
+            break
+
+    textarea = tree.css_first("textarea[name='deskripsi_edit']")
+    data["invoices"] = textarea.text() if textarea is not None else ""
+    data["invoice"] = _parse_invoice_text(data["invoices"])
+    data["tickets"] = _parse_ticket_rows(tree)
+    return data
+
+
+def _detail_as_search_row(html: str) -> Optional[Dict]:
+    """Turn the detail page a single-match search redirects to into a search row.
+
+    The parsed page rides along under "detail", so the caller can use it as
+    the invoice data instead of visiting the same page a second time.
     """
+    detail = _parse_customer_detail(html)
+    if not detail["id"]:
+        return None
+    return {
+        "id": detail["id"],
+        "name": detail["name"],
+        "address": detail["address"],
+        "no_internet": detail["no_internet"],
+        "pppoe_user": "",
+        "mobile": detail["mobile"],
+        "coordinate": detail["coordinate"],
+        "package": detail["paket"],
+        "detail": detail,
+    }
+
+
+def _parse_ticket_rows(tree: LexborHTMLParser) -> List[Dict]:
+    """Parse the Ticket Info table of a detail page in the same pass as the profile.
+
+    The rules are shared with BillingScraper.parse_tickets (parse_ticket_row).
+    """
+    tickets = []
+    for row in tree.css(TICKET_ROWS_SELECTOR):
+        cells = [col.text(strip=True) for col in row.css("td")]
+        timeline = []
+        for item in row.css(".track-order-list ul li"):
+            header = item.css_first("h5")
+            paragraphs = item.css("p.text-muted")
+            timeline.append((
+                header.text(strip=True) if header is not None else "",
+                paragraphs[1].text(strip=True) if len(paragraphs) > 1 else "",
+            ))
+        ticket = parse_ticket_row(cells, timeline)
+        if ticket is not None:
+            tickets.append(ticket)
+    return tickets
+
+
+def _write_state(session_file: Path, state: dict):
+    """Write a storage_state atomically so a crash never leaves half a file."""
+    tmp = session_file.with_suffix(session_file.suffix + ".tmp")
+    try:
+        tmp.write_bytes(orjson.dumps(state))
+        os.replace(tmp, session_file)
+    except OSError as e:
+        logger.warning("Could not write session %s: %s", session_file, e)
 
-    def __init__(self, username: str = None, password: str = None):
-        self.username = username or username_cs
-        self.password = password or password_cs
-        self.playwright = None
-        self.browser = None
-        self.context = None
-        self.page = None
-        self.session_file = SESSION_CS_FILE
-        self._logged_in = False
 
-    def start(self, headless: bool = True):
-        """Start browser (sync). Call this first."""
-        # Ensure session directory exists
-        SESSION_DIR.mkdir(exist_ok=True)
+def _save_state(session_file: Path, state: dict) -> Future:
+    """Queue a session write on the writer thread; the caller need not wait."""
+    return _SAVE_EXECUTOR.submit(_write_state, session_file, state)
 
-        self.playwright = sync_playwright().start()
-        self.browser = self.playwright.chromium.launch(headless=headless)
 
-        # Try to load existing session
-        if self.session_file.exists():
-            logging.info(f"Loading session from {self.session_file}")
-            self.context = self.browser.new_context(
-                storage_state=str(self.session_file)
-            )
+def flush_sessions() -> List[Future]:
+    """Queue every cached storage_state that changed since its last disk write.
+
+    Returns the pending writes so shutdown can wait for them.
+    """
+    pending = []
+    for session_file, state in _STATE_CACHE.items():
+        if _STATE_DIRTY.pop(session_file, False):
+            pending.append(_save_state(session_file, state))
+            _STATE_WRITTEN_AT[session_file] = time.monotonic()
+            logger.info("Session flushed to %s", session_file)
+    return pending
+
+
+def _cached_invoices(customer_id: str) -> Optional[Dict]:
+    hit = _INVOICE_CACHE.get(customer_id)
+    if hit and time.monotonic() - hit[0] < INVOICE_CACHE_TTL:
+        return hit[1]
+    return None
+
+
+def _cache_invoices(customer_id: str, data: Optional[Dict]):
+    if customer_id and data:
+        _INVOICE_CACHE[customer_id] = (time.monotonic(), data)
+
+
+async def _block_assets(route):
+    """Route handler that drops heavy assets and trackers, except the login CAPTCHA image."""
+    request = route.request
+    url = request.url
+    if (
+        request.resource_type in BLOCKED_RESOURCES and "captcha" not in url
+    ) or any(host in url for host in BLOCKED_HOSTS):
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+def _is_login_page(url: str) -> bool:
+    """True if ``url`` is the configured login page (query and trailing slash ignored).
+
+    The login URL (e.g. .../clb.php) need not contain "login", so compare the
+    whole address instead of looking for that word.
+    """
+    def base(u: str) -> str:
+        return u.split("?", 1)[0].split("#", 1)[0].rstrip("/").lower()
+
+    return base(url) == base(LOGIN_URL)
+
+
+def _load_state(session_file: Path) -> Optional[dict]:
+    """Return the cached storage_state, reading the file only on first use."""
+    state = _STATE_CACHE.get(session_file)
+    if state is None and session_file.exists():
+        state = orjson.loads(session_file.read_bytes())
+        _STATE_CACHE[session_file] = state
+    return state
+
+
+class BrowserPool:
+    """One Playwright driver and one Chromium per process, shared by every session.
+
+    Sessions borrow contexts with acquire() and hand them back with release().
+    Returned contexts are kept idle per session file, so the next session on
+    the same login reuses one (cookies included) instead of creating it.
+    """
+
+    def __init__(self, max_idle: int = 2):
+        self.max_idle = max_idle
+        self._playwright = None
+        self._browser = None
+        self._lock = asyncio.Lock()
+        self._idle: Dict[Path, list] = {}
+
+    async def browser(self, headless: bool = True):
+        """Return the shared browser, launching it on first use or after a crash."""
+        async with self._lock:
+            if self._browser is None or not self._browser.is_connected():
+                self._idle.clear()
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+                self._browser = await self._connect()
+                if self._browser is None:
+                    self._browser = await self._playwright.chromium.launch(
+                        headless=headless, args=CHROMIUM_ARGS
+                    )
+                    logger.info("Launched shared Chromium")
+            return self._browser
+
+    async def _connect(self):
+        """Attach to the sidecar Chromium at PW_CDP_ENDPOINT, if one is configured."""
+        if not settings.PW_CDP_ENDPOINT:
+            return None
+        try:
+            browser = await self._playwright.chromium.connect_over_cdp(settings.PW_CDP_ENDPOINT)
+            logger.info("Connected to Chromium at %s", settings.PW_CDP_ENDPOINT)
+            return browser
+        except Exception as e:
+            logger.warning("CDP endpoint unreachable (%s), launching a local Chromium", e)
+            return None
+
+    async def acquire(self, session_file: Path, headless: bool = True, fresh: bool = False):
+        """Borrow a context for ``session_file``; ``fresh`` skips the idle ones."""
+        idle = self._idle.get(session_file, [])
+        while idle and not fresh:
+            context = idle.pop()
+            if context.browser is not None and context.browser.is_connected():
+                return context
+
+        browser = await self.browser(headless)
+        state = _load_state(session_file)
+        if state:
+            logger.info("Restoring session for %s", session_file)
+            context = await browser.new_context(storage_state=state)
         else:
-            logging.info("No existing session found, creating new context")
-            self.context = self.browser.new_context()
+            logger.info("No existing session for %s, creating new context", session_file)
+            context = await browser.new_context()
 
-        self.page = self.context.new_page()
+        # No single Playwright call may outlive the whole job budget
+        context.set_default_timeout(settings.PW_OP_TIMEOUT * 1000)
+        await context.route("**/*", _block_assets)
+        return context
 
-    def save_session(self):
-        """Save current session (cookies, localStorage) to file."""
-        if self.context:
-            self.context.storage_state(path=str(self.session_file))
-            logging.info(f"Session saved to {self.session_file}")
+    async def release(self, session_file: Path, context):
+        """Return a context: keep it idle if there is room, close it otherwise."""
+        idle = self._idle.setdefault(session_file, [])
+        try:
+            for page in context.pages:
+                await page.close()
+            if len(idle) < self.max_idle:
+                idle.append(context)
+                return
+        except Exception as e:
+            logger.warning("Could not reset context for reuse: %s", e)
+        await self.discard(context)
+
+    async def drop_idle(self, session_file: Path):
+        """Close the idle contexts of ``session_file`` (their login is outdated)."""
+        for context in self._idle.pop(session_file, []):
+            await self.discard(context)
+
+    async def discard(self, context):
+        try:
+            await context.close()
+        except Exception as e:
+            logger.warning("Failed to close context: %s", e)
+
+    async def shutdown(self):
+        """Close idle contexts, the browser and the driver."""
+        async with self._lock:
+            for contexts in self._idle.values():
+                for context in contexts:
+                    await self.discard(context)
+            self._idle.clear()
+            if self._browser is not None:
+                await self._browser.close()
+                self._browser = None
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+
+
+BROWSER_POOL = BrowserPool()
+
+
+class BillingSession:
+    """Async Playwright session on the NMS billing portal.
+
+    Owns a context on the shared browser, session persistence and the login
+    flow shared by CustomerService and NOC. Every method is a coroutine, so FastAPI endpoints
+    (through the job queue) await them on the event loop directly.
+    """
 
-    def close(self, save: bool = True):
-        """Close browser and cleanup."""
+    label = "CS"
+    # Protected page used to check whether a restored session is still valid
+    probe_url = LOGIN_URL.replace("login", "")
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        session_file: Path,
+        headless_default: bool = True,
+    ):
+        self.username = username
+        self.password = password
+        self.session_file = session_file
+        self.headless_default = headless_default
+        self.headless = headless_default
+        self.context = None
+        self.page = None
+        self.ops_served = 0
+        self.context_created = 0.0
+        self._logged_in = False
+        self._login_generation = 0  # last login of session_file this context has
+        self._relogin_lock = asyncio.Lock()  # pages of one context re-login once
+
+    async def start(self, headless: bool = None):
+        """Borrow a context from the shared browser pool. Call this first."""
+        self.headless = self.headless_default if headless is None else headless
+
+        # Ensure session directory exists (once per process)
+        global _SESSION_DIR_READY
+        if not _SESSION_DIR_READY:
+            SESSION_DIR.mkdir(exist_ok=True)
+            _SESSION_DIR_READY = True
+
+        await self._new_context()
+
+    async def _new_context(self, fresh: bool = False):
+        self.context = await BROWSER_POOL.acquire(self.session_file, self.headless, fresh)
+        self.page = await self.context.new_page()
+        self.ops_served = 0
+        self.context_created = time.monotonic()
+        # Contexts start from the cached state, so they carry the latest login
+        self._login_generation = _LOGIN_GENERATION.get(self.session_file, 0)
+
+    async def recycle(self):
+        """Swap the context for a fresh one carrying the same session.
+
+        Long-lived contexts accumulate caches and JS heap from every page
+        they visited; recycling bounds that growth.
+        """
+        logger.info(
+            "%s: Recycling context after %s ops / %.0fs",
+            self.label, self.ops_served, time.monotonic() - self.context_created,
+        )
+        await self.save_session()
+        await BROWSER_POOL.discard(self.context)
+        await self._new_context(fresh=True)
+
+    async def save_session(self):
+        """Save current session (cookies, localStorage).
+
+        Unchanged state is skipped entirely. Otherwise the in-memory copy is
+        refreshed; the file is rewritten (on the writer thread) at most once per
+        SESSION_WRITE_INTERVAL, and flush_sessions() writes whatever is still
+        pending at shutdown.
+        """
+        if not self.context:
+            return
+        if self._login_generation != _LOGIN_GENERATION.get(self.session_file, 0):
+            # Another session has logged in since this context got its cookies;
+            # the cache holds that newer login, which sessions adopt from it
+            return
+        state = await self.context.storage_state()
+        if state == _STATE_CACHE.get(self.session_file):
+            # Nothing changed since the last save (the usual case on recycle/close)
+            return
+        _STATE_CACHE[self.session_file] = state
+        _STATE_DIRTY[self.session_file] = True
+
+        now = time.monotonic()
+        last = _STATE_WRITTEN_AT.get(self.session_file)
+        if last is None or now - last >= SESSION_WRITE_INTERVAL:
+            _save_state(self.session_file, state)
+            _STATE_WRITTEN_AT[self.session_file] = now
+            _STATE_DIRTY[self.session_file] = False
+            logger.info("%s: Session saved to %s", self.label, self.session_file)
+
+    async def close(self, save: bool = True, reuse: bool = True):
+        """Hand this session's context back to the pool; the browser keeps running.
+
+        Pass ``reuse=False`` after a failure so the context is closed instead.
+        """
         if save and self.context:
-            self.save_session()
+            await self.save_session()
         if self.context:
-            self.context.close()
-        if self.browser:
-            self.browser.close()
-        if self.playwright:
-            self.playwright.stop()
-
-    def is_logged_in(self) -> bool:
-        """Check if already logged in by trying to access a protected page."""
+            # A context behind the latest login would hand out stale cookies
+            stale = self._login_generation != _LOGIN_GENERATION.get(self.session_file, 0)
+            if reuse and not stale:
+                await BROWSER_POOL.release(self.session_file, self.context)
+            else:
+                await BROWSER_POOL.discard(self.context)
+            self.context = None
+
+    async def _session_probably_valid(self) -> bool:
+        """Cheap check: is there an unexpired auth cookie in the context?
+
+        PHPSESSID is a session cookie (expires == -1), so presence is what counts;
+        _goto_authed() catches the case where the server has dropped it anyway.
+        """
+        now = time.time()
+        for c in await self.context.cookies():
+            if c["name"] in AUTH_COOKIE_NAMES and (c.get("expires", -1) < 0 or c["expires"] > now):
+                return True
+        return False
+
+    async def _invalidate_session(self):
+        """Forget a session the server no longer accepts, so login() redoes it."""
+        logger.info("%s: Session rejected by server, logging in again", self.label)
+        self._logged_in = False
+        await self.context.clear_cookies()
+
+    async def _goto_authed(self, url: str, page=None, **kwargs):
+        """goto() that logs in again once if the server bounces us to login.
+
+        ``page`` defaults to the session's own page. Pages of this context that
+        bounce at the same time share one re-login: a page whose cookies were
+        already renewed while it waited just retries.
+        """
+        page = page or self.page
+        generation = self._login_generation
+        res = await page.goto(url, **kwargs)
+        if "billing2" not in page.url.lower():
+            async with self._relogin_lock:
+                if self._login_generation == generation:
+                    await self._invalidate_session()
+                    await self.login()
+            res = await page.goto(url, **kwargs)
+        return res
+
+    async def is_logged_in(self) -> bool:
+        """Check if already logged in, from cookies first and by navigation otherwise."""
         if self._logged_in:
             return True
+        if await self._session_probably_valid():
+            logger.info("%s: Already logged in (session cookie present)", self.label)
+            self._logged_in = True
+            return True
         try:
-            # Try accessing a protected page directly
-            self.page.goto(LOGIN_URL.replace('login', ''), wait_until="domcontentloaded", timeout=5000)
-            
+            # Only the final URL after redirects matters, which is known at commit
+            await self.page.goto(self.probe_url, wait_until="commit", timeout=5000)
+
             # If we're NOT on the login page, session is valid
             current_url = self.page.url.lower()
             if "login" not in current_url and "billing2" in current_url:
-                logging.info("Already logged in (session restored)")
+                logger.info("%s: Already logged in (session restored)", self.label)
                 self._logged_in = True
                 return True
             return False
         except Exception:
             return False
 
-    def login(self) -> bool:
-        """Login to the billing system."""
+    async def _login_outcome(self, timeout: float = 5000) -> bool:
+        """Race the dashboard redirect against the bad-credentials message.
+
+        Returns True on success and False if neither shows up in time; raises
+        ValueError as soon as the server rejects the credentials.
+        """
+        success = asyncio.create_task(
+            self.page.wait_for_url(DASHBOARD_URL_GLOB, timeout=timeout)
+        )
+        rejected = asyncio.create_task(
+            self.page.locator("text=Invalid username or password")
+            .first.wait_for(state="visible", timeout=timeout)
+        )
+        done, pending = await asyncio.wait(
+            {success, rejected}, return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        if success in done and success.exception() is None:
+            return True
+        if rejected in done and rejected.exception() is None:
+            raise ValueError("Invalid username or password")
+        return False
+
+    async def login(self) -> bool:
+        """Login to the billing system.
+
+        Logins are serialized per session file. A session that queued behind
+        another one's successful login adopts its cookies instead of
+        submitting the credentials again.
+        """
         if not self.page:
             raise RuntimeError("Call start() first")
 
@@ -188,171 +775,335 @@ class CustomerService:
         if self._logged_in:
             return True
 
+        async with _LOGIN_LOCKS.setdefault(self.session_file, asyncio.Lock()):
+            generation = _LOGIN_GENERATION.get(self.session_file, 0)
+            if generation > self._login_generation:
+                await self.context.add_cookies(_STATE_CACHE[self.session_file]["cookies"])
+                self._login_generation = generation
+                self._logged_in = True
+                logger.info("%s: Reusing login from another session", self.label)
+                return True
+            return await self._login()
+
+    async def _login(self) -> bool:
         # Check if saved session is still valid
-        if self.is_logged_in():
+        if await self.is_logged_in():
             return True
 
-        self.page.goto(LOGIN_URL, wait_until="domcontentloaded")
-        logging.info("Going to Login Page")
+        # A failed is_logged_in() probe has usually been redirected to the login
+        # page already; only navigate when we are somewhere else
+        if not _is_login_page(self.page.url):
+            await self.page.goto(LOGIN_URL, wait_until="commit")
+            logger.info("%s: Going to Login Page", self.label)
 
         max_attempts = 3
         for attempt in range(max_attempts):
-            logging.info(f"Login attempt {attempt + 1}/{max_attempts}")
-            
+            logger.info("%s: Login attempt %s/%s", self.label, attempt + 1, max_attempts)
+
+            # The form ends with Sign In; once it is attached the CAPTCHA and
+            # inputs before it have been parsed too
+            await self.page.locator("button", has_text="Sign In").first.wait_for(
+                state="attached"
+            )
+
             # Check for CAPTCHA image
             captcha_img = self.page.locator('img[src*="captcha.php"]').first
-            captcha_input = self.page.locator('input[name="captcha"]').first
-            
+
             captcha_text = None
-            
-            if captcha_img.count() > 0 and captcha_img.is_visible():
-                logging.info("CAPTCHA detected, solving...")
+
+            if await captcha_img.count() > 0 and await captcha_img.is_visible():
+                logger.info("%s: CAPTCHA detected, solving...", self.label)
                 try:
                     # Take screenshot of the CAPTCHA element
-                    captcha_bytes = captcha_img.screenshot()
-                    
-                    # Solve using OCR
-                    ocr_text = ocr(captcha_bytes)
-                    logging.info(f"OCR Result: '{ocr_text}'")
-                    
+                    captcha_bytes = await captcha_img.screenshot()
+
+                    # Solve using OCR on the OCR pool (CPU-bound, keep it off the loop)
+                    loop = asyncio.get_running_loop()
+                    ocr_text = await loop.run_in_executor(_ocr_executor, ocr, captcha_bytes)
+                    logger.info("%s: OCR Result: '%s'", self.label, ocr_text)
+
                     if ocr_text:
                         # Check for math expression
                         math_answer = _evaluate_math_captcha(ocr_text)
-                        
+
                         if math_answer is not None:
                             captcha_text = str(math_answer)
-                            logging.info(f"Math solution: {captcha_text}")
+                            logger.info("%s: Math solution: %s", self.label, captcha_text)
                         else:
                             captcha_text = ocr_text.strip()
-                            logging.info(f"CAPTCHA text: {captcha_text}")
-                            
-                        # Fill CAPTCHA field
-                        if captcha_input.count() > 0:
-                            captcha_input.fill(captcha_text)
+                            logger.info("%s: CAPTCHA text: %s", self.label, captcha_text)
                 except Exception as e:
-                    logging.error(f"Error solving CAPTCHA: {e}")
+                    logger.error("%s: Error solving CAPTCHA: %s", self.label, e)
 
-            self.page.get_by_placeholder("Username").fill(self.username)
-            logging.info("Username filled")
-            self.page.get_by_placeholder("Password").fill(self.password)
-            logging.info("Password filled")
-            self.page.get_by_role("button", name="Sign In").click()
+            # Fill credentials (and CAPTCHA) and click Sign In in one round-trip
+            await self.page.evaluate(LOGIN_FILL_JS, [self.username, self.password, captcha_text])
+            logger.info("%s: Login form submitted", self.label)
 
-            try:
-                self.page.wait_for_url(DASHBOARD_URL_GLOB, timeout=5000)
-                # Save session after successful login
-                self.save_session()
+            if await self._login_outcome():
                 self._logged_in = True
-                logging.info("Login successful")
+                self._login_generation = _LOGIN_GENERATION.get(self.session_file, 0) + 1
+                _LOGIN_GENERATION[self.session_file] = self._login_generation
+                # Idle contexts still carry the cookies this login replaced
+                await BROWSER_POOL.drop_idle(self.session_file)
+                # Save session after successful login
+                await self.save_session()
+                logger.info("%s: Login successful", self.label)
                 return True
-            except PWTimeoutError:
-                err = self.page.get_by_text("Invalid username or password")
-                if err.is_visible():
-                    raise ValueError("Invalid username or password")
-                
-                # If we are still on login page, it's likely a temporary failure or CAPTCHA mismatch
-                if "login" in self.page.url.lower():
-                    logging.warning("Login failed (likely CAPTCHA), retrying...")
-                    if attempt < max_attempts - 1:
-                        time.sleep(1)
-                        # Reload page to get new CAPTCHA
-                        self.page.reload() 
-                        continue
-                    else:
-                        logging.error("Max login attempts reached")
-        
+
+            # If we are still on login page, it's likely a temporary failure or CAPTCHA mismatch
+            if _is_login_page(self.page.url):
+                logger.warning("%s: Login failed (likely CAPTCHA), retrying...", self.label)
+                if attempt < max_attempts - 1:
+                    await asyncio.sleep(1)
+                    # Reload page to get new CAPTCHA
+                    await self.page.reload(wait_until="commit")
+                    continue
+                else:
+                    logger.error("%s: Max login attempts reached", self.label)
+
         raise ValueError("Login failed after multiple attempts")
 
-    def search_user(self, query: str):
+
+class CustomerService(BillingSession):
+    """Playwright service for customer operations."""
+
+    def __init__(self, username: str = None, password: str = None):
+        super().__init__(
+            username or username_cs, password or password_cs, SESSION_CS_FILE
+        )
+
+    async def search_user(self, query: str) -> List[Dict]:
         """Search for customers by name or number.
-        Note: Caller must ensure login() has been called first.
+
+        Tries a plain HTTP request with the saved session cookies first and
+        only drives the browser when that session is missing or expired.
+
+        Returns:
+            List of dicts with keys: id, name, address, no_internet, pppoe_user,
+            status, package_status, mobile, coordinate, package
+        """
+        rows = await self._search_http(query)
+        if rows is None:
+            rows = await self._search_browser(query)
+
+        logger.info("search_user %s returned %d rows", query, len(rows))
+        if logger.isEnabledFor(logging.DEBUG):
+            # A broad name search can match hundreds of customers
+            logger.debug("search_user first rows=%s", rows[:5])
+        return rows
+
+    async def search_many(self, queries: List[str], concurrency: int = 8) -> List[List[Dict]]:
+        """Run several searches at once, results in input order.
+
+        The plain-HTTP searches run concurrently, at most ``concurrency`` in
+        flight; the few that need the browser then go through this session's
+        page one after another.
         """
+        sem = asyncio.Semaphore(concurrency)
 
-        field = self.page.get_by_placeholder("Name Or No Internet")
-        field.fill(query)
-        field.press("Enter")
+        async def over_http(query: str):
+            async with sem:
+                return await self._search_http(query)
 
-        # Wait for search results to load
-        self.page.wait_for_load_state("networkidle")
-        self.page.get_by_text(query, exact=False).first.wait_for(timeout=10_000)
+        results = await asyncio.gather(*(over_http(q) for q in queries))
+        for i, rows in enumerate(results):
+            if rows is None:
+                results[i] = await self._search_browser(queries[i])
+        logger.info("search_many: %d queries", len(queries))
+        return results
+
+    def _seed_http_cookies(self) -> bool:
+        """Give the shared HTTP client this session's cached browser cookies.
+
+        A state is copied only once, so cookies the client got from its own
+        re-login are not overwritten by the older ones on every call.
+        """
+        state = _load_state(self.session_file)
+        if not state:
+            return False
+        if _HTTP_SEEDED.get(self.session_file) is not state:
+            for c in state.get("cookies", []):
+                _http.cookies.set(c["name"], c["value"], domain=c["domain"], path=c["path"])
+            _HTTP_SEEDED[self.session_file] = state
+        return True
+
+    def _store_http_cookies(self, client: httpx.AsyncClient):
+        """Make ``client``'s fresh login the session file's latest one.
+
+        Its cookies replace the same-named ones in the cached storage_state
+        (written out by the next flush), and the login generation moves on,
+        so browser contexts adopt them instead of saving their older cookies.
+        """
+        fresh = [
+            {
+                "name": c.name,
+                "value": c.value,
+                "domain": c.domain,
+                "path": c.path,
+                "expires": c.expires if c.expires is not None else -1,
+                "httpOnly": c.has_nonstandard_attr("HttpOnly"),
+                "secure": c.secure,
+                "sameSite": "Lax",
+            }
+            for c in client.cookies.jar
+        ]
+        replaced = {(c["name"], c["domain"], c["path"]) for c in fresh}
+        state = dict(_load_state(self.session_file) or {"origins": []})
+        state["cookies"] = [
+            c for c in state.get("cookies", [])
+            if (c["name"], c["domain"], c["path"]) not in replaced
+        ] + fresh
+        _STATE_CACHE[self.session_file] = state
+        _STATE_DIRTY[self.session_file] = True
+        _HTTP_SEEDED[self.session_file] = state
+        _LOGIN_GENERATION[self.session_file] = _LOGIN_GENERATION.get(self.session_file, 0) + 1
+
+    async def _search_http(self, query: str) -> Optional[List[Dict]]:
+        """Search without the browser. Returns None if the session is not usable."""
+        if not self._seed_http_cookies():
+            return None
 
-    def get_invoices(self, query: str = None, customer_id: str = None):
+        try:
+            res = await _http.post(SEARCH_URL, data={"type_cari": query, "cari_tagihan": ""})
+        except httpx.HTTPError as e:
+            logger.warning("%s: HTTP search failed, using browser: %s", self.label, e)
+            return None
+
+        # Expired sessions are redirected to the login page; make the browser
+        # fallback log in again instead of trusting the same dead cookie
+        if res.status_code in (401, 403) or "billing2" not in str(res.url):
+            if self.context is not None:
+                await self._invalidate_session()
+            return None
+        # A single match is redirected straight to its detail page
+        if "csp=deusr" in str(res.url):
+            row = _detail_as_search_row(res.text)
+            return [row] if row else None
+        return _parse_search_rows(res.text)
+
+    async def _search_browser(self, query: str) -> List[Dict]:
+        await self.login()
+
+        field = self.page.locator("input[placeholder='Name Or No Internet']")
+        if await field.count() == 0:
+            # A reused page may still be on a detail page from a previous job
+            await self._goto_authed(SEARCH_URL, wait_until="commit")
+        await field.fill(query)
+
+        # Wait for the navigation the submit starts, not just the POST: when
+        # the POST is redirected, its response arrives before the page has
+        # left the current document. The navigation's response is the final
+        # page after redirects; parse that body instead of the rendered DOM.
+        async with self.page.expect_navigation(wait_until="commit") as nav:
+            await field.press("Enter")
+        res = await nav.value
+
+        # A single match lands on its detail page, which already holds
+        # everything get_invoices would fetch
+        if "csp=deusr" in self.page.url:
+            row = _detail_as_search_row(await res.text()) if res is not None else None
+            return [row] if row else []
+        if res is not None and res.ok:
+            return _parse_search_rows(await res.text())
+        await self.page.wait_for_load_state("domcontentloaded")
+        return await self.page.evaluate(SEARCH_ROWS_JS)
+
+    async def get_invoices(self, query: str = None, customer_id: str = None):
         """Get invoice data for a customer.
 
         Args:
             query: Internet number to search for
             customer_id: Customer ID to search for
         """
-        ok = self.login()
-        if not ok:
-            return None
+        if not customer_id and query:
+            # Resolve the internet number to the billing id (search_user logs
+            # in itself when it needs the browser), then open its page
+            logger.info("Searching for: %s", query)
+            rows = await self.search_user(query)
+            if not rows:
+                logger.error("Could not find customer for: %s", query)
+                return None
+            customer_id = rows[0]["id"]
 
-        # Use customer_id or query as search term
-        search_term = customer_id or query
-        if not search_term:
-            logging.error("Either query or customer_id must be provided")
+        if not customer_id:
+            logger.error("Either query or customer_id must be provided")
             return None
 
-        # Search for the user first
-        logging.info(f"Searching for: {search_term}")
-        self.search_user(search_term)
-
-        # Get the Detail User link href and navigate to it
-        # (the link is inside a hidden dropdown menu, so we extract the href directly)
-        detail_link = self.page.locator("a.dropdown-item[href*='deusr']").first
-        if detail_link.count() > 0:
-            href = detail_link.get_attribute("href")
-            if href:
-                # Build full URL from relative href
-                base_url = self.page.url.rsplit("/", 1)[0]
-                detail_url = f"{base_url}/{href}" if not href.startswith("http") else href
-                logging.info(f"Navigating to Detail User: {detail_url}")
-                self.page.goto(detail_url, wait_until="networkidle")
-                logging.info("Navigated to Detail User page")
-            else:
-                logging.error("Detail User link has no href")
-                return None
-        else:
-            logging.error(f"Could not find Detail User link for: {search_term}")
+        data = _cached_invoices(customer_id)
+        if data is not None:
+            logger.info("Invoice data for %s served from cache", customer_id)
+            return data
+
+        # Only a cache miss pays for the login check
+        ok = await self.login()
+        if not ok:
             return None
 
-        # Helper to extract profile values
-        def get_profile_value(label_text: str) -> str:
-            try:
-                label = self.page.locator(f"strong:has-text('{label_text}')").first
-                if label.count() > 0:
-                    value_span = label.locator("xpath=following-sibling::span").first
-                    if value_span.count() > 0:
-                        return value_span.inner_text().strip()
-            except:
-                pass
-            return ""
-
-        # Extract profile data
-        data = {
-            "user_join": get_profile_value("User Join"),
-            "no_internet": get_profile_value("No Internet"),
-            "mobile": get_profile_value("Mobile"),
-            "nik": get_profile_value("NIK"),
-            "paket": get_profile_value("Paket"),
-            "last_payment": get_profile_value("Last Payment"),
-            "uptime": get_profile_value("Uptime"),
-            "bw_usage": get_profile_value("Bw Usage Up/Down"),
-            "sn_modem": get_profile_value("SN Modem"),
-        }
+        # The detail page is server-rendered: parse the navigation response
+        # itself rather than querying the DOM field by field
+        detail_url = INVOICES_URL.format(id=customer_id)
+        logger.info("Navigating to Detail User: %s", detail_url)
+        res = await self._goto_authed(detail_url, wait_until="commit")
+        data = _parse_customer_detail(await res.text())
+        _cache_invoices(customer_id, data)
 
-        # Get the invoice description from textarea
-        textarea = self.page.locator("textarea[name='deskripsi_edit']").first
-        invoices = ""
-        if textarea.count() > 0:
-            invoices = textarea.input_value()
+        logger.info("Invoice data retrieved for: %s", query)
+        return data
 
-        data["invoices"] = invoices
+    async def get_invoices_many(
+        self, customer_ids: List[str], concurrency: int = 8
+    ) -> List[Optional[Dict]]:
+        """Get invoice data for several customers at once, in input order.
 
-        logging.info(f"Invoice data retrieved for: {query}")
-        return data
+        Up to ``concurrency`` pages are opened in this session's context (so
+        they share the login), and each page works through the batch one
+        customer after another instead of a page being opened per customer.
+        A customer that fails to load comes back as None; only a failed
+        re-login aborts the whole batch.
+        """
+        results: List[Optional[Dict]] = [_cached_invoices(c) for c in customer_ids]
+        missing = [(i, c) for i, c in enumerate(customer_ids) if results[i] is None]
+        if not missing:
+            return results
+        await self.login()
+        pending = iter(missing)
+
+        async def drain(page):
+            for i, customer_id in pending:
+                try:
+                    res = await self._goto_authed(
+                        INVOICES_URL.format(id=customer_id), page=page, wait_until="commit"
+                    )
+                    if "billing2" not in page.url.lower():
+                        logger.error("Session rejected while fetching %s", customer_id)
+                        continue
+                    results[i] = _parse_customer_detail(await res.text())
+                except ValueError:
+                    raise  # login() gave up; no other customer can load either
+                except Exception as e:
+                    logger.warning("Fetching invoices for %s failed: %s", customer_id, e)
+                    continue
+                _cache_invoices(customer_id, results[i])
+
+        # Every drain gets its own page; self.page stays free for a re-login
+        n_pages = max(1, min(concurrency, len(missing)))
+        pages = [await self.context.new_page() for _ in range(n_pages)]
+        tasks = [asyncio.create_task(drain(page)) for page in pages]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.exception() is not None:
+                    raise task.exception()
+        finally:
+            # Stop the sibling drains before their pages are closed under them
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for page in pages:
+                await page.close()
+        return results
 
-    def create_ticket(
+    async def create_ticket(
         self, query: str, description: str, priority: str = "LOW", jenis: str = "FREE"
     ):
         """Create a ticket for a customer using pure HTTP (no browser).
@@ -366,68 +1117,72 @@ class CustomerService:
         Returns:
             True on success, False/None on failure
         """
-        import urllib3
-
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-        session = requests.Session()
-        session.headers.update(
-            {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-            }
-        )
-
-        # Step 1: Login via HTTP POST
-        login_payload = {"username": self.username, "password": self.password}
-        try:
-            res = session.post(
-                settings.LOGIN_URL,
-                data=login_payload,
-                verify=False,
-                timeout=10,
-                allow_redirects=True,
-            )
-            if res.status_code not in (200, 302) or "login" in res.url.lower():
-                logging.error("HTTP login failed")
-                return None
-            logging.info("HTTP login successful")
-        except requests.RequestException as e:
-            logging.error(f"Login request failed: {e}")
-            return None
-
-        # Step 2: Search to get HTML with pre-populated modal form
+        # Start from the cached browser session so the usual case needs no
+        # login, and reuse the shared client's pooled connections
+        self._seed_http_cookies()
+        return await self._create_ticket(_http, query, description, priority, jenis)
+
+    async def _create_ticket(
+        self,
+        session: httpx.AsyncClient,
+        query: str,
+        description: str,
+        priority: str,
+        jenis: str,
+    ):
+        # Step 1: Search to get HTML with pre-populated modal form
         search_payload = {"type_cari": query, "cari_tagihan": ""}
+        generation = _LOGIN_GENERATION.get(self.session_file, 0)
         try:
-            res = session.post(
-                settings.BILLING_MODULE_BASE,
-                data=search_payload,
-                verify=False,
-                timeout=15,
-                allow_redirects=True,
+            res = await session.post(
+                settings.BILLING_MODULE_BASE, data=search_payload, timeout=15
             )
             res.raise_for_status()
-        except requests.RequestException as e:
-            logging.error(f"Search request failed: {e}")
+
+            # Step 2: Only when the saved session was rejected, login via HTTP
+            # POST and search again. Logins share the browser's per-file lock;
+            # a ticket that waited while another login renewed the cookies
+            # just retries with them.
+            if "billing2" not in str(res.url).lower():
+                async with _LOGIN_LOCKS.setdefault(self.session_file, asyncio.Lock()):
+                    if _LOGIN_GENERATION.get(self.session_file, 0) != generation:
+                        self._seed_http_cookies()
+                    else:
+                        login_payload = {"username": self.username, "password": self.password}
+                        res = await session.post(
+                            settings.LOGIN_URL, data=login_payload, timeout=10
+                        )
+                        if res.status_code not in (200, 302) or "login" in str(res.url).lower():
+                            logger.error("HTTP login failed")
+                            return None
+                        self._store_http_cookies(session)
+                        logger.info("HTTP login successful")
+
+                res = await session.post(
+                    settings.BILLING_MODULE_BASE, data=search_payload, timeout=15
+                )
+                res.raise_for_status()
+        except httpx.HTTPError as e:
+            logger.error("Search request failed: %s", e)
             return None
 
-        # Step 3: Parse modal form from search results
-        soup = BeautifulSoup(res.text, "html.parser")
-        modal = soup.select_one("div[id^='create_tiga_modal']")
-        if not modal:
-            logging.error(f"No ticket modal found for query: {query}")
+        # Step 3: Find the ticket modal form in the search results
+        modal = LexborHTMLParser(res.text).css_first("div[id^='create_tiga_modal']")
+        if modal is None:
+            logger.error("No ticket modal found for query: %s", query)
             return None
 
         # Step 4: Extract all form fields from modal
-        form = modal.find("form")
-        if not form:
-            logging.error("Ticket form not found in modal")
+        form = modal.css_first("form")
+        if form is None:
+            logger.error("Ticket form not found in modal")
             return None
 
-        payload = {}
-        for inp in form.find_all("input"):
-            name = inp.get("name")
-            if name:
-                payload[name] = inp.get("value", "")
+        payload = {
+            inp.attributes["name"]: inp.attributes.get("value") or ""
+            for inp in form.css("input[name]")
+            if inp.attributes["name"]
+        }
 
         # Override with user-provided values
         payload["priority"] = priority.upper()
@@ -435,28 +1190,24 @@ class CustomerService:
         payload["deskripsi"] = description
         payload["create_ticket_gangguan"] = ""  # Submit button name
 
-        logging.info(f"Submitting ticket for query: {query}")
+        logger.info("Submitting ticket for query: %s", query)
 
         # Step 5: Submit the form
         try:
-            res = session.post(
-                settings.BILLING_MODULE_BASE,
-                data=payload,
-                verify=False,
-                timeout=15,
-                allow_redirects=True,
-            )
+            res = await session.post(settings.BILLING_MODULE_BASE, data=payload, timeout=15)
             res.raise_for_status()
 
             if "berhasil" in res.text.lower() or res.status_code == 200:
-                logging.info(f"Ticket created successfully for query: {query}")
+                # The detail page now lists the new ticket
+                _INVOICE_CACHE.pop(payload.get("id_pelanggan"), None)
+                logger.info("Ticket created successfully for query: %s", query)
                 return True
             else:
-                logging.error("Ticket creation may have failed")
+                logger.error("Ticket creation may have failed")
                 return False
 
-        except requests.RequestException as e:
-            logging.error(f"Submit request failed: {e}")
+        except httpx.HTTPError as e:
+            logger.error("Submit request failed: %s", e)
             return None
 
     @staticmethod
@@ -464,373 +1215,340 @@ class CustomerService:
         text: str,
     ) -> Tuple[Optional[str], Optional[int], Optional[int]]:
         """Parse month and year from text like 'Januari 2025'."""
-        if not text:
-            return None, None, None
-        t = text.strip()
-        low = t.lower()
-        for indo, eng in MONTH_MAP_ID.items():
-            if indo in low:
-                t = low.replace(indo, eng).title()
-                break
-        m = re.search(r"([A-Za-z]+)\s+(\d{4})", t)
+        m = PERIOD_RE.search(text or "")
         if not m:
             return None, None, None
-        mname, y = m.group(1), m.group(2)
-        try:
-            dt = datetime.strptime(f"{mname} {y}", "%B %Y")
-            return m.group(0), dt.month, dt.year
-        except Exception:
-            return m.group(0), None, None
+        month, year = MONTH_NUM[m.group(1).lower()], int(m.group(2))
+        return f"{MONTH_EN[month - 1]} {year}", month, year
 
     @staticmethod
     def _parser_whatsapp_url(mobile: str) -> Optional[str]:
         """Generate WhatsApp URL from mobile number."""
-        if not mobile:
-            return None
-        clean_number = mobile.strip()
-        if clean_number == "0":
+        clean_number = (mobile or "").strip()
+        if not PHONE_RE.fullmatch(clean_number):
             return None
         return f"https://wa.me/{clean_number}"
 
     @staticmethod
     def _parser_maps_url(coordinate: str) -> Optional[str]:
         """Generate Google Maps URL from coordinates."""
-        if not coordinate:
-            return None
-        clean_coordinate = coordinate.strip()
-        if clean_coordinate == "0":
+        clean_coordinate = (coordinate or "").strip()
+        if not COORDINATE_RE.fullmatch(clean_coordinate):
             return None
         return f"https://www.google.com/maps?q={clean_coordinate}"
 
 
-class NOC:
-    """Sync Playwright service for NOC operations."""
+class NOC(BillingSession):
+    """Playwright service for NOC operations."""
+
+    label = "NOC"
+    probe_url = DATA_PSB_URL
 
     def __init__(self, username: str = None, password: str = None):
-        self.username = username or username_noc
-        self.password = password or password_noc
-        self.playwright = None
-        self.browser = None
-        self.context = None
-        self.page = None
-        self.session_file = SESSION_NOC_FILE
-        self._logged_in = False
+        super().__init__(
+            username or username_noc, password or password_noc, SESSION_NOC_FILE
+        )
 
-    def start(self, headless: bool = True):
-        SESSION_DIR.mkdir(exist_ok=True)
+    async def process_ticket(self, nama_pelanggan: str, action: str):
+        # TODO: Implement ticket processing logic (the Selenium flow in
+        # services/open_ticket.py handles it for now)
+        raise NotImplementedError("NOC.process_ticket is not implemented yet")
 
-        self.playwright = sync_playwright().start()
-        self.browser = self.playwright.chromium.launch(headless=headless)
+    async def get_data_psb(self) -> list:
+        """Get PSB (Pemasangan Baru) data from the NOC dashboard.
+        
+        Returns:
+            List of dicts with keys: name, address, username, password, package
+        """
+        await self.login()
+        # The row modals sit after the table in the document, so wait for the
+        # full DOM (not for idle network) before reading both in one evaluate
+        await self._goto_authed(DATA_PSB_URL, wait_until="domcontentloaded")
+        logger.info("Navigated to PSB data page")
 
-        if self.session_file.exists():
-            logging.info(f"Loading NOC session from {self.session_file}")
-            self.context = self.browser.new_context(
-                storage_state=str(self.session_file)
-            )
+        # Wait for the table to load
+        table = self.page.locator("#tickets-note")
+        await table.wait_for(state="visible", timeout=10_000)
+
+        # One round-trip: every row's cells plus the Framed-Pool line of its
+        # "Details" modal, which is already in the DOM (no clicking needed)
+        rows = await table.evaluate(PSB_ROWS_JS)
+        logger.info("Found %s PSB rows", len(rows))
+
+        results = []
+        for i, row in enumerate(rows):
+            cells = row["cells"]
+            if len(cells) < 5:
+                logger.warning("Failed to parse PSB row %s: %s cells", i, len(cells))
+                continue
+
+            # Parse: "Framed-Pool   =   CIGNAL 25M (RP 125.000)"
+            package = ""
+            parts = " ".join(row["pool"].split()).split("=", 1)
+            if len(parts) == 2:
+                package = parts[1].strip()
+
+            results.append({
+                "name": cells[0],
+                "address": cells[1],
+                "username": cells[3],
+                "password": cells[4],
+                "package": package,
+            })
+
+        logger.info("Extracted %s PSB records", len(results))
+        return results
+
+
+async def _customer_with_invoices(service: "CustomerService", query: str):
+    """Search, then fetch invoices when exactly one customer matches."""
+    results = await service.search_user(query)
+    if not results:
+        return None, None
+
+    if len(results) == 1:
+        # Single matches usually arrive with their detail page already parsed
+        invoices = results[0].pop("detail", None)
+        if invoices is not None:
+            _cache_invoices(results[0]["id"], invoices)
         else:
-            logging.info("No existing NOC session found, creating new context")
-            self.context = self.browser.new_context()
+            invoices = await service.get_invoices(customer_id=results[0]["id"])
+        return results, invoices
 
-        self.page = self.context.new_page()
+    return results, None
 
-    def save_session(self):
-        if self.context:
-            self.context.storage_state(path=str(self.session_file))
-            logging.info(f"NOC session saved to {self.session_file}")
 
-    def close(self, save: bool = True):
-        if save and self.context:
-            self.save_session()
-        if self.context:
-            self.context.close()
-        if self.browser:
-            self.browser.close()
-        if self.playwright:
-            self.playwright.stop()
+# --- Job queue ---
+# FastAPI handlers enqueue jobs instead of driving a browser inline. A fixed
+# set of workers drains the queue, which caps browser concurrency and smooths
+# request bursts.
 
-    def is_logged_in(self) -> bool:
-        if self._logged_in:
-            return True
-        try:
-            # Check NOC session by going to PSB data page
-            self.page.goto(DATA_PSB_URL, wait_until="domcontentloaded", timeout=5000)
-            
-            current_url = self.page.url.lower()
-            
-            # Check for login redirection
-            if "login" in current_url:
-                return False
 
-            # Check for specific element that confirms we are logged in
-            # The PSB table should be visible if we are at DATA_PSB_URL and logged in
-            try:
-                self.page.wait_for_selector("#tickets-note", timeout=3000)
-                logging.info("Already logged in (NOC session restored)")
-                self._logged_in = True
-                return True
-            except:
-                # If table not found, maybe we are on dashboard but not PSB page?
-                # Check for common dashboard element
-                if self.page.locator(".navbar-custom").count() > 0:
-                     logging.info("Already logged in (NOC session restored)")
-                     self._logged_in = True
-                     return True
-            
-            return False
-        except Exception:
-            return False
+@dataclass
+class Job:
+    op: str
+    kwargs: dict
+    future: asyncio.Future
 
-    def login(self) -> bool:
-        if not self.page:
-            raise RuntimeError("Call start() first")
-        
-        # Skip if already logged in this session
-        if self._logged_in:
-            return True
 
-        # Check if saved session is still valid
-        if self.is_logged_in():
-            return True
+async def _op_psb(worker: "_Worker"):
+    return await (await worker.service(NOC)).get_data_psb()
 
-        self.page.goto(LOGIN_URL, wait_until="domcontentloaded")
-        logging.info("NOC: Going to Login Page")
 
-        max_attempts = 3
-        for attempt in range(max_attempts):
-            logging.info(f"NOC: Login attempt {attempt + 1}/{max_attempts}")
-            
-            # Check for CAPTCHA image
-            captcha_img = self.page.locator('img[src*="captcha.php"]').first
-            captcha_input = self.page.locator('input[name="captcha"]').first
-            
-            captcha_text = None
-            
-            if captcha_img.count() > 0 and captcha_img.is_visible():
-                logging.info("NOC: CAPTCHA detected, solving...")
-                try:
-                    # Take screenshot of the CAPTCHA element
-                    captcha_bytes = captcha_img.screenshot()
-                    
-                    # Solve using OCR
-                    ocr_text = ocr(captcha_bytes)
-                    logging.info(f"NOC: OCR Result: '{ocr_text}'")
-                    
-                    if ocr_text:
-                        # Check for math expression
-                        math_answer = _evaluate_math_captcha(ocr_text)
-                        
-                        if math_answer is not None:
-                            captcha_text = str(math_answer)
-                            logging.info(f"NOC: Math solution: {captcha_text}")
-                        else:
-                            captcha_text = ocr_text.strip()
-                            logging.info(f"NOC: CAPTCHA text: {captcha_text}")
-                            
-                        # Fill CAPTCHA field
-                        if captcha_input.count() > 0:
-                            captcha_input.fill(captcha_text)
-                except Exception as e:
-                    logging.error(f"NOC: Error solving CAPTCHA: {e}")
+async def _op_customer_with_invoices(worker: "_Worker", query: str):
+    return await _customer_with_invoices(await worker.service(CustomerService), query)
 
-            # Fill credentials
-            self.page.get_by_placeholder("Username").fill(self.username)
-            logging.info("NOC: Username filled")
-            self.page.get_by_placeholder("Password").fill(self.password)
-            logging.info("NOC: Password filled")
-            
-            # Click sign in
-            self.page.get_by_role("button", name="Sign In").click()
 
-            try:
-                # Wait for either success (dashboard) or failure
-                self.page.wait_for_url(DASHBOARD_URL_GLOB, timeout=5000)
-                self.save_session()
-                self._logged_in = True
-                logging.info("NOC: Login successful")
-                return True
-                
-            except PWTimeoutError:
-                # Check for specific error messages
-                err_msg = self.page.locator("text=Invalid username or password")
-                if err_msg.count() > 0 and err_msg.is_visible():
-                    raise ValueError("Invalid username or password")
-                
-                # If we are still on login page, it's likely a temporary failure or CAPTCHA mismatch
-                if "login" in self.page.url.lower():
-                    logging.warning("NOC: Login failed (likely CAPTCHA), retrying...")
-                    if attempt < max_attempts - 1:
-                        time.sleep(1)
-                        # Reload page to get new CAPTCHA
-                        self.page.reload() 
-                        continue
-                    else:
-                        logging.error("NOC: Max login attempts reached")
-                        
-        raise ValueError("Login failed after multiple attempts")
+async def _op_invoices(worker: "_Worker", customer_id: str):
+    return await (await worker.service(CustomerService)).get_invoices(customer_id=customer_id)
 
-    def process_ticket(self, nama_pelanggan: str, action: str):
-        self.page.goto(LOGIN_URL, wait_until="domcontentloaded")
-        # TODO: Implement ticket processing logic
-        pass
 
-    def get_data_psb(self) -> list:
-        """Get PSB (Pemasangan Baru) data from the NOC dashboard.
-        
-        Returns:
-            List of dicts with keys: name, address, username, password, package
-        """
-        self.login()
-        self.page.goto(DATA_PSB_URL, wait_until="networkidle")
-        logging.info("Navigated to PSB data page")
+_OPS = {
+    "psb": _op_psb,
+    "customer_with_invoices": _op_customer_with_invoices,
+    "invoices": _op_invoices,
+}
 
-        # Wait for the table to load
-        table = self.page.locator("#tickets-note")
-        table.wait_for(state="visible", timeout=10_000)
 
-        results = []
-        rows = table.locator("tbody tr")
-        row_count = rows.count()
-        logging.info(f"Found {row_count} PSB rows")
+class _Worker:
+    """Queue consumer that owns the sessions it starts.
 
-        for i in range(row_count):
-            row = rows.nth(i)
-            cells = row.locator("td")
+    Each worker keeps one long-lived instance per service class, so the number
+    of workers caps how many pages are driven at once.
+    """
 
-            try:
-                name = cells.nth(0).inner_text().strip()
-                address = cells.nth(1).inner_text().strip()
-                username = cells.nth(3).inner_text().strip()
-                password = cells.nth(4).inner_text().strip()
+    def __init__(self, index: int):
+        self.index = index
+        self._services: Dict[type, object] = {}
+        self.ready = False  # set once warm-up (if any) has finished
 
-                # Open the detail modal to get Framed-Pool (package)
-                package = ""
-                try:
-                    # Click the dropdown toggle in the Action column
-                    dropdown_toggle = row.locator("a.dropdown-toggle").first
-                    dropdown_toggle.click()
-                    
-                    # Click the Details link
-                    details_link = row.locator("a.dropdown-item:has-text('Details')").first
-                    details_link.wait_for(state="visible", timeout=3000)
-                    details_link.click()
-                    
-                    # Wait for modal to appear
-                    modal = self.page.locator(".modal.show .modal-body")
-                    modal.wait_for(state="visible", timeout=5000)
-                    
-                    # Extract Framed-Pool value from modal text
-                    modal_text = modal.inner_text()
-                    for line in modal_text.split("\n"):
-                        if "Framed-Pool" in line:
-                            # Parse: "Framed-Pool   =   CIGNAL 25M (RP 125.000)"
-                            parts = line.split("=", 1)
-                            if len(parts) == 2:
-                                package = parts[1].strip()
-                            break
-                    
-                    logging.info(f"Row {i} package: {package}")
-                    
-                    # Close the modal
-                    close_btn = self.page.locator(".modal.show button[data-dismiss='modal']").first
-                    if close_btn.count() > 0:
-                        close_btn.click()
-                        self.page.wait_for_timeout(500)
-                        
-                except Exception as e:
-                    logging.warning(f"Failed to get package for row {i}: {e}")
-
-                results.append({
-                    "name": name,
-                    "address": address,
-                    "username": username,
-                    "password": password,
-                    "package": package,
-                })
+    async def _started(self, cls):
+        svc = self._services.get(cls)
+        if svc is None:
+            svc = cls()
+            await svc.start()
+            self._services[cls] = svc
+        return svc
+
+    async def service(self, cls):
+        """Return this worker's long-lived instance of ``cls``, starting it once.
+
+        Its context is recycled after PW_CONTEXT_MAX_OPS jobs or
+        PW_CONTEXT_MAX_AGE seconds, whichever comes first.
+        """
+        svc = await self._started(cls)
+        if (
+            svc.ops_served >= settings.PW_CONTEXT_MAX_OPS
+            or time.monotonic() - svc.context_created >= settings.PW_CONTEXT_MAX_AGE
+        ):
+            await svc.recycle()
+        svc.ops_served += 1
+        return svc
+
+    async def warm(self):
+        """Start and log in the CS session before the first job arrives.
+
+        login() trusts any PHPSESSID restored from disk, so one authenticated
+        request proves the server still accepts it (and logs in again if not)
+        before the worker reports ready.
+        """
+        try:
+            svc = await self._started(CustomerService)
+            await svc.login()
+            await svc._goto_authed(SEARCH_URL, wait_until="commit")
+            if "billing2" not in svc.page.url.lower():
+                raise ValueError("session still rejected after login")
+            logger.info("Worker %s: warmed up", self.index)
+        except Exception as e:
+            logger.warning("Worker %s: warm-up failed: %s", self.index, e)
+            await self.close_services(failed=True)
+
+    async def close_services(self, failed: bool = False):
+        """Close this worker's sessions; after a failure their contexts are dropped."""
+        services, self._services = self._services, {}
+        for svc in services.values():
+            try:
+                await svc.close(save=not failed, reuse=not failed)
             except Exception as e:
-                logging.warning(f"Failed to parse PSB row {i}: {e}")
-                continue
+                logger.warning("Worker %s: failed to close service: %s", self.index, e)
+
+    async def run(self, queue: asyncio.Queue):
+        if settings.PW_WARM_START:
+            await self.warm()
+        self.ready = True
+        while True:
+            job = await queue.get()
+            timeout = settings.PW_OP_TIMEOUT
+            try:
+                result = await asyncio.wait_for(_OPS[job.op](self, **job.kwargs), timeout)
+            except asyncio.TimeoutError:
+                logger.error(
+                    "Worker %s: %s exceeded %ss, replacing its sessions",
+                    self.index, job.op, timeout,
+                )
+                await self.close_services(failed=True)
+                if not job.future.done():
+                    job.future.set_exception(
+                        TimeoutError(f"{job.op} timed out after {timeout}s")
+                    )
+            except Exception as e:
+                # Start from a clean context on the next job
+                await self.close_services(failed=True)
+                if not job.future.done():
+                    job.future.set_exception(e)
+            except asyncio.CancelledError:
+                # stop_workers(): the caller must not wait forever
+                if not job.future.done():
+                    job.future.set_exception(RuntimeError("Playwright workers stopped"))
+                raise
+            else:
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                queue.task_done()
 
-        logging.info(f"Extracted {len(results)} PSB records")
-        return results
+    async def stop(self):
+        await self.close_services()
 
 
-# Convenience functions for running sync methods from async endpoints
-def search_customer_sync(query: str, headless: bool = True):
-    """Run customer search synchronously (for use with run_sync)."""
-    service = CustomerService()
-    try:
-        service.start(headless=headless)
-        return service.search_user(query)
-    finally:
-        service.close()
+JOB_Q: Optional[asyncio.Queue] = None
+_workers: List[Tuple[_Worker, asyncio.Task]] = []
+_persist_task: Optional[asyncio.Task] = None
 
 
-def get_customer_with_invoices_sync(query: str, headless: bool = True):
-    """Search and get invoices for single customer (for use with run_sync)."""
-    service = CustomerService()
-    try:
-        service.start(headless=headless)
-        results = service.search_user(query)
-        if not results:
-            return None, None
+async def _persist_sessions():
+    """Snapshot the workers' live contexts to disk every SESSION_WRITE_INTERVAL.
 
-        if len(results) == 1:
-            invoices = service.get_invoices(results[0]["id"])
-            return results, invoices
+    Long-lived contexts keep their cookies in memory and only save on
+    recycle/close, so without this a crash would lose a fresh login.
+    """
+    while True:
+        await asyncio.sleep(SESSION_WRITE_INTERVAL)
+        for worker, _ in _workers:
+            for svc in list(worker._services.values()):
+                try:
+                    await svc.save_session()
+                except Exception as e:
+                    logger.warning("Worker %s: periodic session save failed: %s", worker.index, e)
+        flush_sessions()
 
-        return results, None
-    finally:
-        service.close()
 
+async def start_workers(n: int = None):
+    """Spawn the queue workers. Call once from the FastAPI lifespan handler."""
+    global JOB_Q, _persist_task
+    if JOB_Q is not None:
+        return
+    JOB_Q = asyncio.Queue()
+    n = n or settings.PW_WORKERS
+    for i in range(n):
+        worker = _Worker(i)
+        _workers.append((worker, asyncio.create_task(worker.run(JOB_Q))))
+    _persist_task = asyncio.create_task(_persist_sessions())
+    logger.info("Started %s Playwright workers", len(_workers))
 
-def get_customer_details_sync(
-    customer_id: str, headless: bool = True
-) -> Optional[Customer]:
-    """Get comprehensive customer details (for use with run_sync)."""
-    service = CustomerService()
-    try:
-        service.start(headless=headless)
-        return service.get_invoices(customer_id=customer_id)
-    finally:
-        service.close()
 
+def workers_ready() -> bool:
+    """True once every worker has finished warming up and is taking jobs."""
+    return bool(_workers) and all(worker.ready for worker, _ in _workers)
 
-def get_invoice_data_sync(
-    customer_id: str, headless: bool = True
-) -> Optional[CustomerwithInvoices]:
-    """Get detailed invoice data for customer (for use with run_sync)."""
-    service = CustomerService()
-    try:
-        service.start(headless=headless)
-        return service.get_invoices(customer_id=customer_id)
-    finally:
-        service.close()
 
+async def stop_workers():
+    """Cancel the workers, close their sessions, the shared browser and HTTP client.
 
-def get_psb_data_sync(headless: bool = True) -> list:
-    """Get PSB data (for use with run_sync)."""
-    noc = NOC()
-    try:
-        noc.start(headless=headless)
-        return noc.get_data_psb()
-    finally:
-        noc.close()
+    Jobs still queued or running fail with RuntimeError instead of leaving
+    their submit() callers waiting.
+    """
+    global JOB_Q, _persist_task, _http
+    if _persist_task is not None:
+        _persist_task.cancel()
+        _persist_task = None
+    for worker, task in _workers:
+        task.cancel()
+    await asyncio.gather(*(task for _, task in _workers), return_exceptions=True)
+    while JOB_Q is not None and not JOB_Q.empty():
+        job = JOB_Q.get_nowait()
+        if not job.future.done():
+            job.future.set_exception(RuntimeError("Playwright workers stopped"))
+    for worker, task in _workers:
+        await worker.stop()
+    _workers.clear()
+    JOB_Q = None
+    await asyncio.gather(*map(asyncio.wrap_future, flush_sessions()))
+    await BROWSER_POOL.shutdown()
+    # Swap in an unopened client: its pool holds no connections, and HTTP
+    # callers (tickets, a later start_workers()) never get a closed one
+    client, _http = _http, _new_http_client()
+    _HTTP_SEEDED.clear()
+    await client.aclose()
+
+
+async def submit(op: str, **kwargs):
+    """Enqueue a Playwright job and wait for its result."""
+    if op not in _OPS:
+        raise ValueError(f"Unknown Playwright op: {op}")
+    if JOB_Q is None:
+        await start_workers()
+    fut = asyncio.get_running_loop().create_future()
+    await JOB_Q.put(Job(op, kwargs, fut))
+    return await fut
 
 
 if __name__ == "__main__":
-    # Test sync version
-    service = NOC()
-    try:
-        service.start(headless=False)
-
-        # Fast method: use encoded customer ID directly
-        # Example ID from the detail URL
-        print("=== Testing FAST method (direct customer_id) ===")
-        psb_data = service.get_data_psb()
-        print(psb_data)
-        # Slow method: search by internet number
-        # print("=== Testing SLOW method (search query) ===")
-        # invoices = service.get_invoices(query="10009124")
-        # print("Invoice Data:", invoices)
-    finally:
-        service.close()
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    async def main():
+        service = NOC()
+        try:
+            await service.start(headless=False)
+            psb_data = await service.get_data_psb()
+            print(psb_data)
+            # Search by internet number
+            # invoices = await CustomerService().get_invoices(query="10009124")
+            # print("Invoice Data:", invoices)
+        finally:
+            await service.close()
+            await BROWSER_POOL.shutdown()
+
+    asyncio.run(main())
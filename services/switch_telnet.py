@@ -65,7 +65,7 @@ class SwitchClient:
             telnetlib3.open_connection(self.host, 23), timeout=20
         )
         await self._login()
-        self.last_activity = asyncio.get_event_loop().time()
+        self.last_activity = asyncio.get_running_loop().time()
     
     async def close(self):
         """Close Manual"""
@@ -118,7 +118,7 @@ class TelnetClient:
         )
         await self._login()
         await self._disable_pagination()
-        self.last_activity = asyncio.get_event_loop().time()
+        self.last_activity = asyncio.get_running_loop().time()
 
     async def close(self):
         """Fungsi close manual"""